@@ -0,0 +1,113 @@
+# ============================================================
+# AAA — AI RESULT STORE
+# PERSISTENT MODEL OUTPUTS KEYED BY INPUT HASH
+# ============================================================
+#
+# Model calls are deterministic enough for our purposes once the input
+# text, prompt template version and model name are fixed, so their output
+# is stored under a hash of those three and reused. Each result also keeps
+# how long it took to generate and how many tokens it used.
+
+import hashlib
+import time
+
+import sqlite_util
+
+RESULTS_FILE = "ai_results.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key        TEXT PRIMARY KEY,
+    kind       TEXT NOT NULL,
+    model      TEXT NOT NULL,
+    text       TEXT NOT NULL,
+    created    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_results_kind ON results(kind, created);
+"""
+
+# Columns added after the first release of the table
+EXTRA_COLUMNS = {
+    "latency_ms": "REAL",
+    "input_tokens": "INTEGER",
+    "output_tokens": "INTEGER",
+    "hits": "INTEGER NOT NULL DEFAULT 0",
+    "ttft_ms": "REAL",
+}
+
+
+def result_key(kind, model_name, prompt_version, *inputs):
+    h = hashlib.sha256()
+    for part in (kind, model_name, prompt_version) + inputs:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+def response_tokens(response):
+    # (input, output) token counts reported by the model, or (None, None)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None, None
+    return (getattr(usage, "prompt_token_count", None),
+            getattr(usage, "candidates_token_count", None))
+
+
+class ResultStore:
+    def __init__(self, db_path=RESULTS_FILE):
+        self.db_path = db_path
+        self._conn = sqlite_util.LocalConnection(self.db_path)
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+            have = {r[1] for r in conn.execute("PRAGMA table_info(results)")}
+            for col, decl in EXTRA_COLUMNS.items():
+                if col not in have:
+                    conn.execute(f"ALTER TABLE results ADD COLUMN {col} {decl}")
+
+    def get(self, key):
+        # Reusing a stored result in place of a model call counts as a hit
+        entry = self.get_entry(key, hit=True)
+        return entry["text"] if entry else None
+
+    def get_entry(self, key, hit=False):
+        # Plain reads (a page showing a result on every rerun) write nothing;
+        # hit=True also counts one reuse of the result
+        row = self._conn().execute(
+            "SELECT text, model, created, latency_ms, input_tokens, output_tokens, hits, ttft_ms "
+            "FROM results WHERE key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        text, model, created, latency, tin, tout, hits, ttft = row
+        if hit:
+            self.count_hit(key)
+            hits += 1
+        return {"text": text, "model": model, "created": created, "latency_ms": latency,
+                "ttft_ms": ttft, "input_tokens": tin, "output_tokens": tout, "hits": hits}
+
+    def count_hit(self, key):
+        with self._conn() as conn:
+            conn.execute("UPDATE results SET hits = hits + 1 WHERE key = ?", (key,))
+
+    def put(self, key, kind, model_name, text, latency_ms=None, input_tokens=None,
+            output_tokens=None, ttft_ms=None):
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(key, kind, model, text, created, latency_ms, input_tokens, output_tokens, ttft_ms) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, model_name, text, time.time(), latency_ms, input_tokens,
+                 output_tokens, ttft_ms),
+            )
+
+    def stats(self, kind=None):
+        sql = "SELECT COUNT(*), COALESCE(SUM(hits), 0), AVG(latency_ms), " \
+              "COALESCE(SUM(input_tokens), 0), COALESCE(SUM(output_tokens), 0) FROM results"
+        args = ()
+        if kind:
+            sql += " WHERE kind = ?"
+            args = (kind,)
+        n, hits, latency, tin, tout = self._conn().execute(sql, args).fetchone()
+        return {"results": n, "hits": hits, "avg_latency_ms": latency or 0.0,
+                "input_tokens": tin, "output_tokens": tout}
@@ -0,0 +1,59 @@
+# ============================================================
+# AAA — STREAMING MODEL OUTPUT
+# PARTIAL RENDERING • CANCELLATION • TTFT / TOTAL LATENCY
+# ============================================================
+#
+# stream_generate() calls generate_content(stream=True) and hands the text
+# received so far to on_text after every chunk, so the page can render it
+# as it arrives. should_stop() is polled between chunks; Streamlit also
+# cancels a run on its own when the user presses any button, in which case
+# the last partial text is whatever on_text last saw.
+
+import time
+
+import perf
+from ai_results import response_tokens
+
+
+class StreamResult:
+    def __init__(self):
+        self.text = ""
+        self.ttft_ms = None
+        self.total_ms = None
+        self.input_tokens = None
+        self.output_tokens = None
+        self.cancelled = False
+
+
+def _chunk_text(chunk):
+    # Safety-blocked or empty chunks raise on .text in google-generativeai
+    try:
+        return chunk.text or ""
+    except ValueError:
+        return ""
+
+
+def stream_generate(model, prompt, on_text=None, should_stop=None):
+    result = StreamResult()
+    start = time.perf_counter()
+    response = model.generate_content(prompt, stream=True)
+
+    for chunk in response:
+        piece = _chunk_text(chunk)
+        if not piece:
+            continue
+        if result.ttft_ms is None:
+            result.ttft_ms = (time.perf_counter() - start) * 1000
+        result.text += piece
+        if on_text:
+            on_text(result.text)
+        if should_stop and should_stop():
+            result.cancelled = True
+            break
+
+    result.total_ms = (time.perf_counter() - start) * 1000
+    perf.record("model.stream", result.total_ms / 1000, len(result.text.encode("utf-8")),
+                model=getattr(model, "model_name", type(model).__name__))
+    if not result.cancelled:
+        result.input_tokens, result.output_tokens = response_tokens(response)
+    return result
@@ -4,12 +4,24 @@
 # ============================================================
 
 import streamlit as st
-import json
 import os
 import shutil
-from datetime import datetime
-from google import generativeai as genai
-import fitz   # PyMuPDF for PDF rendering
+import time
+from datetime import datetime, timedelta
+from ocr_pipeline import run_ocr, cached_ocr, join_pages, OCR_MODEL, OCR_PROMPT
+from ocr_cache import OcrCache
+from pdf_text import text_layer_pages, OCR_MODE, TEXT_MIN_SCORE
+from image_prep import preprocess, preprocess_pages, prep_signature, PrepReport, PDF_DPI
+from render_cache import RenderCache
+from vault import Vault
+from snapshots import SnapshotStore
+from ai_results import ResultStore, result_key
+from ai_stream import stream_generate
+from insights_engine import generate_insights, INSIGHTS_MODEL
+from jobs import JobQueue
+from static_assets import img_tag, payload_report
+from model_client import get_client, configure, client_stats, ModelUnavailable, MODEL_BACKEND
+import perf
 
 # ============================================================
 # CONFIG
@@ -21,27 +33,31 @@ st.set_page_config(
     layout="wide",
 )
 
-genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+# Heavy libraries load on first use by the pages that need them:
+# google.generativeai when the first Gemini client is created
+# (model_client.py), PyMuPDF on the first PDF render or OCR, Pillow on the
+# first image preprocess. Health Log, Vault, Merged View and Search never
+# import them.
+
+@st.cache_resource
+def configure_model_backend():
+    # Once per process, not on every rerun. The offline stub backend
+    # (AAA_MODEL_BACKEND=stub) needs no key.
+    if MODEL_BACKEND == "gemini":
+        configure(st.secrets["GEMINI_API_KEY"])
+
+
+configure_model_backend()
 
 # ============================================================
 # HEADER + FOOTER
 # ============================================================
 
 def aaa_header():
-    import streamlit as st
-    import base64
-
-    # Read the logo file in binary
-    with open("assets/logo.png", "rb") as f:
-        data = f.read()
-
-    # Convert to base64 string
-    encoded = base64.b64encode(data).decode()
-
-    # Build HTML with embedded base64 image
+    # Resized logo served from static/ — see static_assets.py
     html = f"""
     <div style="width:100%; text-align:center; margin-top:10px;">
-        <img src="data:image/png;base64,{encoded}" style="width:150px;">
+        {img_tag("logo", 150)}
     </div>
     """
 
@@ -69,33 +85,233 @@ def aaa_footer():
 # JSON HELPERS
 # ============================================================
 
+# Backed by the append-only journal engine in storage.py; each data
+# partition gets one mtime-invalidated DataStore shared across sessions.
+# AAA_STORAGE_ENGINE=sqlite switches to the indexed SQLite engine instead.
+from storage import DataStore, file_lock, lock_stats
+from sqlite_store import SqliteStore
+from search_index import SearchIndex
+from timeline import TimelineIndex
+from partitions import get_partition, list_partitions, DEFAULT_PARTITION
+
+STORAGE_ENGINE = os.environ.get("AAA_STORAGE_ENGINE", "json").lower()
+
+
+# ============================================================
+# DATA PARTITIONS (one per user / patient profile)
+# ============================================================
+
+def current_partition():
+    return get_partition(st.session_state.get("partition", DEFAULT_PARTITION))
+
+
+# Per-partition resources are created once and shared by every session and
+# worker thread (see partitions.py); `part` defaults to the session's own.
+
+def get_store(part=None):
+    part = part or current_partition()
+    if STORAGE_ENGINE == "sqlite":
+        return part.resource("store", lambda: SqliteStore(part.db_file, part.log_file, part.ocr_file))
+    return part.resource("store", DataStore)
+
+
+def get_search_index(part=None):
+    part = part or current_partition()
+    return part.resource("search", lambda: SearchIndex(part.index_file))
+
+
+def get_timeline(part=None):
+    # Brought up to date with the data files when first opened in this
+    # process; after that pages add events as they write
+    part = part or current_partition()
+    store = get_store(part)
+
+    def build():
+        timeline = TimelineIndex(part.timeline_file)
+        timeline.sync_source(part.log_file, "log", store.load(part.log_file, []))
+        timeline.sync_source(part.ocr_file, "ocr", store.load(part.ocr_file, []))
+        return timeline
+
+    return part.resource("timeline", build)
+
+
+# Uploads are stored as deduplicated blobs; see vault.py
+def get_vault(part=None):
+    part = part or current_partition()
+    return part.resource("vault", lambda: Vault(part.vault_dir))
+
+
+def get_photo_vault(part=None):
+    part = part or current_partition()
+    return part.resource("photos", lambda: Vault(part.photo_dir))
+
+
 def load_json(path, default):
-    if not os.path.exists(path):
-        return default
-    try:
-        with open(path, "r") as f:
-            return json.load(f)
-    except:
-        return default
+    return get_store().load(path, default)
 
 
 def save_json(path, data):
-    with open(path, "w") as f:
-        json.dump(data, f, indent=4)
+    get_store().save(path, data)
+
+
+def append_json(path, record):
+    get_store().append(path, record)
+
+
+PAGE_SIZE = 25          # default records per page in history lists
+PAGE_SIZES = [10, 25, 50, 100]
+PREVIEW_CHARS = 500     # body characters sent before "Show full text"
+SUMMARY_CHOICES = 200   # most recent records offered in Summary AI
+
+
+def history_list(key, fetch, count, title, body, monospace=False):
+    # Cursor-paginated record list with a date-range filter.
+    # fetch(cursor, limit, start, end) → [(position, item)] following `cursor`
+    # count(start, end) → number of matching items
+    # Only the visible slice is fetched, and long bodies are only sent to the
+    # browser in full when asked for, so a page costs the same at any history size.
+    c1, c2 = st.columns([3, 1])
+    with c1:
+        dates = st.date_input("Date range", value=(), key=f"{key}_dates")
+    with c2:
+        size = st.selectbox("Per page", PAGE_SIZES, index=PAGE_SIZES.index(PAGE_SIZE),
+                            key=f"{key}_size")
+
+    start = str(dates[0]) if dates else None
+    end = str(dates[-1] + timedelta(days=1)) if dates else None
+
+    # cursors[-1] is where the current page starts; earlier ones allow going back.
+    # Cursors are positions in one profile's data, so each profile has its own.
+    state = st.session_state.setdefault(f"{key}:{current_partition().id}",
+                                        {"filters": None, "cursors": [None]})
+    if state["filters"] != (start, end, size):
+        state["filters"], state["cursors"] = (start, end, size), [None]
+
+    rows = fetch(state["cursors"][-1], size + 1, start, end)
+    more = len(rows) > size
+    rows = rows[:size]
+
+    for pos, item in rows:
+        with st.expander(title(item)):
+            text = body(item)
+            if len(text) > PREVIEW_CHARS and not st.toggle("Show full text", key=f"{key}_full_{pos}"):
+                text = text[:PREVIEW_CHARS] + " …"
+            if monospace:
+                st.text(text)
+            else:
+                st.write(text)
+
+    def forward():
+        state["cursors"].append(rows[-1][0])
+
+    def back():
+        state["cursors"].pop()
+
+    first = (len(state["cursors"]) - 1) * size
+    n1, n2, n3 = st.columns([1, 1, 4])
+    n1.button("◀ Previous", key=f"{key}_prev", on_click=back, disabled=len(state["cursors"]) == 1)
+    n2.button("Next ▶", key=f"{key}_next", on_click=forward, disabled=not more)
+    if rows:
+        n3.caption(f"{first + 1}–{first + len(rows)} of {count(start, end)}")
+    else:
+        n3.caption("No entries in this range.")
 
 
 # ============================================================
-# DIRECTORIES
+# BACKGROUND JOBS
 # ============================================================
 
-HEALTH_LOG_FILE = "health_log.json"
-VAULT_DIR = "vault_files"
-OCR_DATA_FILE = "ocr_results.json"
-SNAPSHOT_DIR = "snapshots"
-PHOTO_DIR = "photos"
-
-for d in [VAULT_DIR, SNAPSHOT_DIR, PHOTO_DIR]:
-    os.makedirs(d, exist_ok=True)
+OCR_JOB_PRIORITY = 0
+SUMMARY_JOB_PRIORITY = 10   # short, interactive — ahead of bulk OCR
+JOB_POLL_SECONDS = 1.5
+
+
+def ocr_file(path, filename, model, cache, on_progress=None):
+    # OCR one stored upload → (text, served_from_cache, prep report, page paths).
+    # Retries happen in the model client, so the pipeline's own retry loop is off.
+    report = PrepReport()
+    if filename.lower().endswith(".pdf"):
+        import fitz   # PyMuPDF
+        with fitz.open(path) as doc:
+            total = len(doc)
+            # Hybrid mode: pages with a usable text layer never reach the model
+            layer = text_layer_pages(doc) if OCR_MODE == "hybrid" else {}
+            paths = {n: "text" for n in layer}
+            for done, n in enumerate(sorted(layer), 1):
+                if on_progress:
+                    on_progress(n, "text", done, total)
+
+            def progress(page_no, state, done, _):
+                paths[page_no] = {"cached": "cache", "done": "model"}.get(state, state)
+                if on_progress:
+                    on_progress(page_no, state, len(layer) + done, total)
+
+            todo = [n for n in range(1, total + 1) if n not in layer]
+            pages = preprocess_pages(render_pdf_pages(doc, only=todo), report=report)
+            results = run_ocr(pages, model, total=len(todo), retries=0,
+                              on_progress=progress, cache=cache) if todo else []
+        return join_pages(sorted(results + list(layer.items()))), False, report, paths
+
+    with open(path, "rb") as f:
+        image_bytes = preprocess(f.read(), report=report)
+    text, hit = cached_ocr(model, image_bytes, cache=cache, retries=0)
+    return text, hit, report, {1: "cache" if hit else "model"}
+
+
+@st.cache_resource
+def get_job_queue():
+    # Partition resources come from the job's payload (never from
+    # st.session_state, which worker threads can't see)
+    icons = {"queued": "⏳", "text": "📄", "cached": "♻️", "done": "✅", "failed": "❌"}
+
+    def handle_ocr(payload, progress):
+        part = get_partition(payload["partition"])
+        status = {}
+
+        def on_progress(page_no, state, done, total):
+            status[page_no] = state
+            progress(done / total, f"{done}/{total} pages  " +
+                     " ".join(f"{icons[status[n]]}{n}" for n in sorted(status)))
+
+        text, hit, report, paths = ocr_file(payload["path"], payload["filename"],
+                                           get_client(OCR_MODEL), get_ocr_cache(part), on_progress)
+
+        entry = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "filename": payload["filename"],
+            "text": text
+        }
+        get_store(part).append(part.ocr_file, entry)
+        get_search_index(part).add_ocr(entry)
+        get_timeline(part).add("ocr", entry, part.ocr_file)
+        return {"text": text, "cached": hit, "prep": report.as_dict(),
+                "paths": {str(n): p for n, p in sorted(paths.items())}}
+
+    def handle_summary(payload, progress):
+        part = get_partition(payload["partition"])
+        progress(0.1, "Generating summary…")
+        result = stream_generate(
+            get_client(SUMMARY_MODEL), payload["prompt"],
+            lambda text: progress(0.5, f"{len(text):,} characters received…"),
+        )
+        get_result_store(part).put(payload["key"], "summary", SUMMARY_MODEL, result.text,
+                                   result.total_ms, result.input_tokens, result.output_tokens,
+                                   result.ttft_ms)
+        get_timeline(part).add("summary", summary_event(result.text), part.results_file)
+        return {"key": payload["key"]}
+
+    return JobQueue({"ocr": handle_ocr, "summary": handle_summary})
+
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def job_progress(job_id):
+    # Polls one job; once it leaves the queue the whole page reruns to show the result
+    job = get_job_queue().get(job_id)
+    if job["status"] in ("queued", "running"):
+        label = job["message"] or ("Waiting in queue…" if job["status"] == "queued" else "Working…")
+        st.progress(job["progress"], text=label)
+    else:
+        st.rerun()
 
 
 # ============================================================
@@ -105,25 +321,32 @@ for d in [VAULT_DIR, SNAPSHOT_DIR, PHOTO_DIR]:
 def page_health_log():
     aaa_header()
     st.subheader("🧿 Daily Health Log")
+    part = current_partition()
 
     date = st.date_input("Date")
     notes = st.text_area("Notes / Symptoms / Observations")
 
     if st.button("Save Entry"):
-        log = load_json(HEALTH_LOG_FILE, [])
-        log.append({
+        entry = {
             "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             "date": str(date),
             "notes": notes
-        })
-        save_json(HEALTH_LOG_FILE, log)
+        }
+        append_json(part.log_file, entry)
+        get_search_index().add_log(entry)
+        get_timeline().add("log", entry, part.log_file)
         st.success("Entry saved successfully!")
 
     st.write("### Previous Log Entries")
-    log = load_json(HEALTH_LOG_FILE, [])
-    for entry in reversed(log):
-        with st.expander(f"{entry['date']}"):
-            st.write(entry["notes"])
+    store = get_store()
+    history_list(
+        "log_list",
+        # By the entry's own date (what the rows show), not when it was saved
+        lambda cursor, limit, start, end: store.scan(part.log_file, limit, cursor, True, start, end, by="date"),
+        lambda start, end: store.count(part.log_file, start, end, by="date"),
+        title=lambda entry: f"{entry['date']}",
+        body=lambda entry: entry["notes"],
+    )
 
     aaa_footer()
 
@@ -138,19 +361,39 @@ def page_vault():
 
     uploaded = st.file_uploader("Upload Image/PDF", type=["png", "jpg", "jpeg", "pdf"])
 
+    vault = get_vault()
+
     if uploaded:
-        save_path = os.path.join(VAULT_DIR, uploaded.name)
-        with open(save_path, "wb") as f:
-            f.write(uploaded.getbuffer())
-        st.success(f"{uploaded.name} saved successfully!")
+        # Stored once per upload: the uploader keeps the file across reruns,
+        # and storing it again would undo a Delete
+        stored = st.session_state.setdefault("vault_stored", {})
+        if uploaded.file_id not in stored:
+            stored[uploaded.file_id] = vault.store(uploaded, uploaded.name)
+        name, is_new = stored[uploaded.file_id]
+        if vault.info(name) is None:
+            pass   # deleted since the upload
+        elif is_new:
+            st.success(f"{name} saved successfully!")
+        else:
+            st.info(f"{name} is already in the vault.")
 
     st.write("### Stored Files")
-    files = os.listdir(VAULT_DIR)
+    files = vault.list()
     if not files:
         st.info("No files uploaded yet.")
     else:
         for f in files:
-            st.write(f)
+            c1, c2 = st.columns([5, 1])
+            with c1:
+                st.write(f)
+            with c2:
+                st.button("Delete", key=f"vault_delete_{f}", on_click=vault.delete, args=(f,))
+
+        vs = vault.stats()
+        st.caption(
+            f"{vs['files']} files • {vs['stored_bytes'] / 1e6:.1f} MB on disk • "
+            f"{vs['saved_bytes'] / 1e6:.1f} MB saved by dedup"
+        )
 
     aaa_footer()
 
@@ -159,11 +402,22 @@ def page_vault():
 # PAGE 3 — PDF PREVIEW
 # ============================================================
 
+THUMBS_PER_VIEW = 12
+THUMB_COLUMNS = 4
+PAGES_PER_VIEW = 2
+
+
+def get_render_cache(part=None):
+    part = part or current_partition()
+    return part.resource("render_cache", lambda: RenderCache(part.render_dir))
+
+
 def page_pdf_preview():
     aaa_header()
     st.subheader("📄 PDF Preview")
 
-    pdfs = [f for f in os.listdir(VAULT_DIR) if f.lower().endswith(".pdf")]
+    vault = get_vault()
+    pdfs = [f for f in vault.list() if f.lower().endswith(".pdf")]
 
     if not pdfs:
         st.info("No PDF files found.")
@@ -171,15 +425,46 @@ def page_pdf_preview():
         return
 
     selected = st.selectbox("Select PDF", pdfs)
-    pdf_path = os.path.join(VAULT_DIR, selected)
+    pdf_path = vault.path_for(selected)
+    cache = get_render_cache()
 
     try:
-        doc = fitz.open(pdf_path)
-        for i, page in enumerate(doc):
-            pix = page.get_pixmap()
-            st.image(pix.tobytes(), caption=f"Page {i+1}", use_container_width=True)
+        total = cache.page_count(pdf_path)
     except:
         st.error("Failed to load PDF.")
+        aaa_footer()
+        return
+
+    st.caption(f"{total} pages")
+
+    # Thumbnails first: one small window of the document at a time
+    thumb_pages = max(1, -(-total // THUMBS_PER_VIEW))
+    thumb_view = st.number_input(
+        f"Thumbnail set (1–{thumb_pages})", min_value=1, max_value=thumb_pages, value=1,
+        key=f"thumbs_{selected}",
+    ) if thumb_pages > 1 else 1
+    first = (thumb_view - 1) * THUMBS_PER_VIEW + 1
+
+    cols = st.columns(THUMB_COLUMNS)
+    for i, page_no in enumerate(range(first, min(first + THUMBS_PER_VIEW, total + 1))):
+        with cols[i % THUMB_COLUMNS]:
+            st.image(cache.thumbnail(pdf_path, page_no), caption=f"Page {page_no}")
+            if st.button("Open", key=f"open_{selected}_{page_no}"):
+                st.session_state[f"pdf_page_{selected}"] = page_no
+
+    # Full resolution on demand, only for the pages in view
+    st.write("### Page View")
+    c1, c2 = st.columns(2)
+    with c1:
+        start = st.number_input(
+            "Page", min_value=1, max_value=total, key=f"pdf_page_{selected}",
+        )
+    with c2:
+        zoom = st.select_slider("Zoom", options=[1.0, 1.5, 2.0, 3.0], value=1.5)
+
+    for page_no in range(start, min(start + PAGES_PER_VIEW, total + 1)):
+        st.image(cache.render(pdf_path, page_no, zoom), caption=f"Page {page_no}",
+                 use_container_width=True)
 
     aaa_footer()
 
@@ -188,64 +473,111 @@ def page_pdf_preview():
 # PAGE 4 — OCR (Advanced)
 # ============================================================
 
+def get_ocr_cache(part=None):
+    part = part or current_partition()
+    return part.resource("ocr_cache", lambda: OcrCache(part.ocr_cache_file))
+
+
+def render_pdf_pages(doc, dpi=PDF_DPI, only=None):
+    # Render stage of the OCR pipeline: one grayscale PNG per page at `dpi`,
+    # produced lazily; `only` limits it to those 1-based page numbers
+    import fitz
+    matrix = fitz.Matrix(dpi / 72, dpi / 72)
+    for n in (only if only is not None else range(1, len(doc) + 1)):
+        with perf.span("pdf.get_pixmap", use="ocr") as s:
+            data = doc[n - 1].get_pixmap(matrix=matrix, colorspace=fitz.csGRAY).tobytes("png")
+            s.bytes = len(data)
+        yield n, data
+
+
 def page_ocr():
     aaa_header()
     st.subheader("🔍 Advanced OCR Extraction")
+    part = current_partition()
 
     file = st.file_uploader("Upload image or PDF", type=["png", "jpg", "jpeg", "pdf"])
 
     if file:
-        st.info("Processing… 3–10 seconds…")
-
-        temp_path = os.path.join(PHOTO_DIR, file.name)
-        with open(temp_path, "wb") as f:
-            f.write(file.getbuffer())
-
-        extracted_text = ""
+        jobs = get_job_queue()
+        # Submitted once per upload; reruns (including the one job_progress
+        # triggers when the job ends) only look the job up again
+        slot = f"ocr_job:{part.id}:{file.file_id}"
+        if slot not in st.session_state:
+            # Stored as a deduplicated blob; identical uploads in flight share one job
+            photo_vault = get_photo_vault()
+            stored_name, is_new = photo_vault.store(file, file.name)
+            if is_new and not file.name.lower().endswith(".pdf"):
+                get_timeline().add("photo", {
+                    "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                    "filename": file.name,
+                    "stored_as": stored_name,
+                }, part.photo_dir)
+            blob = photo_vault.info(stored_name)["blob"]
+            payload = {"path": photo_vault.path_for(stored_name), "filename": file.name,
+                       "partition": part.id}
+            dedup = f"{part.id}:{blob}:{OCR_MODEL}:{OCR_PROMPT}:{prep_signature()}:{OCR_MODE}:{TEXT_MIN_SCORE}"
+            st.session_state[slot] = {
+                "job": jobs.submit("ocr", payload, priority=OCR_JOB_PRIORITY, dedup_key=dedup),
+                "payload": payload, "dedup": dedup,
+            }
+
+        upload = st.session_state[slot]
+        job = jobs.get(upload["job"])
+
+        def run_again():
+            upload["job"] = jobs.submit("ocr", upload["payload"], priority=OCR_JOB_PRIORITY,
+                                        dedup_key=upload["dedup"])
+
+        if job["status"] in ("queued", "running"):
+            st.info("Processing in the background — you can keep working or leave this page.")
+            job_progress(job["id"])
+
+        elif job["status"] == "failed":
+            st.error(f"OCR failed: {job['message']}")
+            st.button("Retry OCR", on_click=jobs.retry, args=(job["id"],))
 
-        # ------ PDF CASE ------
-        if file.name.lower().endswith(".pdf"):
-            doc = fitz.open(temp_path)
-            st.write(f"Pages detected: {len(doc)}")
-
-            for i, page in enumerate(doc):
-                pix = page.get_pixmap()
-                img_bytes = pix.tobytes("png")
-
-                st.write(f"Page {i+1}")
-
-                response = genai.GenerativeModel("gemini-2.0-flash").generate_content(
-                    ["Extract ALL text (no summary).", img_bytes]
+        else:
+            extracted_text = job["result"]["text"]
+            st.success("OCR Completed!")
+            if job["result"].get("cached"):
+                st.caption("♻️ Served from OCR cache")
+            paths = job["result"].get("paths") or {}
+            if len(paths) > 1 or "text" in paths.values():
+                names = {"text": "📄 text layer", "cache": "♻️ cache", "model": "✅ model",
+                         "failed": "❌ failed"}
+                by_path = {}
+                for n, p in paths.items():
+                    by_path.setdefault(p, []).append(n)
+                st.caption(" • ".join(f"{names.get(p, p)}: page(s) {', '.join(ns)}"
+                                      for p, ns in by_path.items()))
+            prep = job["result"].get("prep")
+            if prep and prep["images"]:
+                st.caption(
+                    f"Preprocessing: {prep['bytes_in'] / 1e6:.2f} MB → {prep['bytes_out'] / 1e6:.2f} MB "
+                    f"over {prep['images']} image(s) • {prep['bytes_saved'] / 1e6:.2f} MB saved "
+                    f"(~{prep['upload_s_saved']:.1f}s upload) • {prep['prep_ms']:.0f} ms"
                 )
+            st.text_area("Extracted Text", extracted_text, height=300)
+            st.button("🔄 Run OCR again", on_click=run_again)
 
-                extracted_text += f"\n\n--- PAGE {i+1} ---\n" + response.text
-
-        # ------ Image case ------
-        else:
-            image_bytes = file.getvalue()
-            response = genai.GenerativeModel("gemini-2.0-flash").generate_content(
-                ["Extract ALL text (no summary).", image_bytes]
+            cs = get_ocr_cache().stats()
+            st.caption(
+                f"OCR cache: {cs['hit_rate']:.0%} hit rate • {cs['entries']} entries • "
+                f"{cs['bytes'] / 1e6:.1f}/{cs['max_bytes'] / 1e6:.0f} MB"
             )
-            extracted_text = response.text
-
-        # Save OCR
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        ocr_log = load_json(OCR_DATA_FILE, [])
-        ocr_log.append({
-            "timestamp": timestamp,
-            "filename": file.name,
-            "text": extracted_text
-        })
-        save_json(OCR_DATA_FILE, ocr_log)
-
-        st.success("OCR Completed!")
-        st.text_area("Extracted Text", extracted_text, height=300)
 
     # Show previous OCR
     st.write("### Previous OCR Results")
-    for entry in load_json(OCR_DATA_FILE, []):
-        with st.expander(f"{entry['timestamp']} — {entry['filename']}"):
-            st.text(entry["text"])
+    store = get_store()
+    history_list(
+        "ocr_list",
+        lambda cursor, limit, start, end: store.scan(part.ocr_file, limit, cursor, False, start, end,
+                                                     by="timestamp"),
+        lambda start, end: store.count(part.ocr_file, start, end, by="timestamp"),
+        title=lambda entry: f"{entry['timestamp']} — {entry['filename']}",
+        body=lambda entry: entry["text"],
+        monospace=True,
+    )
 
     aaa_footer()
 
@@ -254,18 +586,31 @@ def page_ocr():
 # PAGE 5 — SNAPSHOTS
 # ============================================================
 
-def save_snapshot():
-    snap = {
-        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-        "health_log": load_json(HEALTH_LOG_FILE, []),
-        "ocr": load_json(OCR_DATA_FILE, []),
-    }
+def _open_snapshots(part, store):
+    snapshots = SnapshotStore(part.snapshot_dir)
+    if STORAGE_ENGINE == "sqlite":
+        # Older versions kept SQLite-engine snapshots in the database
+        for name, timestamp, data in store.legacy_snapshots():
+            snapshots.create(name, timestamp, data)
+        store.drop_legacy_snapshots()
+    return snapshots
+
+
+def get_snapshot_store(part=None):
+    part = part or current_partition()
+    store = get_store(part)
+    return part.resource("snapshots", lambda: _open_snapshots(part, store))
 
-    name = f"snapshot_{snap['timestamp'].replace(':','-').replace(' ','_')}.json"
-    path = os.path.join(SNAPSHOT_DIR, name)
 
-    with open(path, "w") as f:
-        json.dump(snap, f, indent=4)
+def save_snapshot():
+    part = current_partition()
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    name = f"snapshot_{timestamp.replace(':','-').replace(' ','_')}.json"
+
+    # Both files read at one point in time
+    with file_lock(part.log_file), file_lock(part.ocr_file):
+        data = {"health_log": load_json(part.log_file, []), "ocr": load_json(part.ocr_file, [])}
+    get_snapshot_store().create(name, timestamp, data)
 
     return name
 
@@ -273,38 +618,57 @@ def save_snapshot():
 def page_snapshots():
     aaa_header()
     st.subheader("📸 Data Snapshots")
+    part = current_partition()
+
+    snapshots = get_snapshot_store()
 
     if st.button("💾 Create Snapshot"):
         name = save_snapshot()
         st.success(f"Snapshot saved: {name}")
         st.experimental_rerun()
 
-    snaps = sorted(os.listdir(SNAPSHOT_DIR))
+    snaps = snapshots.list()
 
     if not snaps:
         st.info("No snapshots found.")
         aaa_footer()
         return
 
-    for snap in snaps:
+    st.caption(f"{len(snaps)} snapshots • {snapshots.disk_usage() / 1e6:.1f} MB on disk")
+
+    for meta in reversed(snaps):
+        snap = meta["name"]
         with st.expander(snap):
-            path = os.path.join(SNAPSHOT_DIR, snap)
-            with open(path, "r") as f:
-                data = json.load(f)
-            st.json(data)
+            st.write(
+                f"**{meta['timestamp']}** — {meta['counts']['health_log']} log entries, "
+                f"{meta['counts']['ocr']} OCR results • "
+                f"{meta['new_blocks']} new blocks ({meta['new_bytes'] / 1e3:.1f} KB)"
+            )
 
-            c1, c2 = st.columns(2)
+            c1, c2, c3 = st.columns(3)
 
             with c1:
+                # Bodies are only loaded when asked for
+                if st.toggle("Show contents", key=f"show_{snap}"):
+                    st.json(snapshots.load(snap))
+
+            with c2:
                 if st.button(f"Restore {snap}", key=f"restore_{snap}"):
-                    save_json(HEALTH_LOG_FILE, data["health_log"])
-                    save_json(OCR_DATA_FILE, data["ocr"])
+                    data = snapshots.load(snap)
+                    # Both files and the indexes change together; the file locks
+                    # also hold off writers in other app processes
+                    with part.lock, file_lock(part.log_file), file_lock(part.ocr_file):
+                        save_json(part.log_file, data["health_log"])
+                        save_json(part.ocr_file, data["ocr"])
+                        get_search_index().rebuild(data["health_log"], data["ocr"])
+                        get_timeline().sync_source(part.log_file, "log", data["health_log"])
+                        get_timeline().sync_source(part.ocr_file, "ocr", data["ocr"])
                     st.success("Snapshot restored.")
                     st.experimental_rerun()
 
-            with c2:
+            with c3:
                 if st.button(f"Delete {snap}", key=f"delete_{snap}"):
-                    os.remove(path)
+                    snapshots.delete(snap)
                     st.warning("Snapshot deleted.")
                     st.experimental_rerun()
 
@@ -315,12 +679,44 @@ def page_snapshots():
 # PAGE 6 — SUMMARY AI
 # ============================================================
 
+def summary_event(text):
+    # Timeline record for a newly generated summary
+    return {"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "text": text}
+
+
+def describe_result(entry):
+    when = datetime.fromtimestamp(entry["created"]).strftime("%Y-%m-%d %H:%M")
+    line = f"Generated {when} in {(entry['latency_ms'] or 0) / 1000:.1f}s"
+    if entry["ttft_ms"] is not None:
+        line += f" (first token {entry['ttft_ms'] / 1000:.2f}s)"
+    if entry["input_tokens"] is not None and entry["output_tokens"] is not None:
+        line += f" • {entry['input_tokens']:,} in / {entry['output_tokens']:,} out tokens"
+    return line + f" • viewed {entry['hits']}×"
+
+
+SUMMARY_MODEL = "gemini-2.0-flash"
+SUMMARY_PROMPT_VERSION = "summary-v1"
+SUMMARY_PROMPT = """
+Create a structured medical summary with:
+- Key symptoms
+- Risk markers
+- Trends
+- Patient-friendly explanation
+
+TEXT:
+{text}
+"""
+
+
 def page_summary():
     aaa_header()
     st.subheader("🧠 AI Summary Report")
+    part = current_partition()
 
-    logs = load_json(HEALTH_LOG_FILE, [])
-    ocr = load_json(OCR_DATA_FILE, [])
+    # Newest first, capped so the selectboxes stay small on long histories
+    store = get_store()
+    logs = store.query(part.log_file, 0, SUMMARY_CHOICES)
+    ocr = store.query(part.ocr_file, 0, SUMMARY_CHOICES)
 
     log_choice = st.selectbox(
         "Select Health Log Entry",
@@ -334,35 +730,85 @@ def page_summary():
         format_func=lambda i: ocr[i]["filename"] if ocr else "None"
     ) if ocr else None
 
-    if st.button("Generate Summary"):
-        parts = []
+    parts = []
+
+    if log_choice is not None:
+        parts.append(f"HEALTH LOG:\n{logs[log_choice]}")
+
+    if ocr_choice is not None:
+        parts.append(f"OCR TEXT:\n{ocr[ocr_choice]['text']}")
+
+    # Same inputs + prompt version + model → same stored summary
+    results = get_result_store()
+    prompt = SUMMARY_PROMPT.format(text="\n\n".join(parts)) if parts else None
+    key = result_key("summary", SUMMARY_MODEL, SUMMARY_PROMPT_VERSION, prompt) if parts else None
+    # A stored summary counts as viewed once per session, not on every rerun
+    seen = st.session_state.setdefault("summaries_seen", set())
+    entry = results.get_entry(key, hit=key not in seen) if key else None
+    if entry:
+        seen.add(key)
+
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        generate = st.button("Generate Summary")
+    with c2:
+        regenerate = st.button("🔄 Regenerate", disabled=entry is None)
+    with c3:
+        background = st.toggle("Run in background")
 
-        if log_choice is not None:
-            parts.append(f"HEALTH LOG:\n{logs[log_choice]}")
+    pending = st.session_state.setdefault("summary_jobs", {})
 
-        if ocr_choice is not None:
-            parts.append(f"OCR TEXT:\n{ocr[ocr_choice]['text']}")
+    if ((generate and entry is None) or regenerate) and parts and background:
+        pending[key] = get_job_queue().submit(
+            "summary", {"key": key, "prompt": prompt, "partition": part.id},
+            priority=SUMMARY_JOB_PRIORITY, dedup_key=f"{part.id}:{key}",
+        )
 
+    job = get_job_queue().get(pending[key]) if key in pending else None
+
+    if job and job["status"] in ("queued", "running"):
+        job_progress(job["id"])
+
+    elif job and job["status"] == "failed":
+        st.error(f"Summary failed: {job['message']}")
+        pending.pop(key)
+
+    elif (generate and entry is None) or regenerate:
         if not parts:
             st.error("Nothing selected.")
             return
 
-        prompt = "\n\n".join(parts)
+        # Any button press reruns the script, which cancels the stream
+        st.button("⏹ Stop", key="summary_stop")
+        box = st.empty()
 
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(f"""
-        Create a structured medical summary with:
-        - Key symptoms
-        - Risk markers
-        - Trends
-        - Patient-friendly explanation
-
-        TEXT:
-        {prompt}
-        """)
+        def on_text(text):
+            st.session_state["summary_partial"] = (key, text)
+            box.markdown(text + " ▌")
 
+        try:
+            result = stream_generate(get_client(SUMMARY_MODEL), prompt, on_text)
+        except ModelUnavailable as e:
+            box.empty()
+            st.error(str(e))
+            return
+        box.empty()
+        st.session_state.pop("summary_partial", None)
+
+        results.put(key, "summary", SUMMARY_MODEL, result.text, result.total_ms,
+                    result.input_tokens, result.output_tokens, result.ttft_ms)
+        get_timeline().add("summary", summary_event(result.text), part.results_file)
+        entry = results.get_entry(key)
+        seen.add(key)
         st.success("Summary generated.")
-        st.markdown(response.text)
+
+    elif entry is None and st.session_state.get("summary_partial", (None,))[0] == key:
+        st.warning("Generation stopped — partial output below (not saved).")
+        st.markdown(st.session_state.pop("summary_partial")[1])
+
+    if entry:
+        st.caption(describe_result(entry))
+        st.markdown(entry["text"])
 
     aaa_footer()
 
@@ -375,35 +821,38 @@ def page_merged():
     aaa_header()
     st.subheader("🔗 Unified Merged View")
 
-    logs = load_json(HEALTH_LOG_FILE, [])
-    ocr = load_json(OCR_DATA_FILE, [])
-
-    combined = []
-
-    for x in logs:
-        combined.append({
-            "timestamp": x["timestamp"],
-            "type": "Health Log",
-            "content": x["notes"]
-        })
+    timeline = get_timeline()
 
-    for x in ocr:
-        combined.append({
-            "timestamp": x["timestamp"],
-            "type": f"OCR: {x['filename']}",
-            "content": x["text"]
-        })
-
-    if not combined:
+    if not timeline.count():
         st.info("No data found.")
         aaa_footer()
         return
 
-    combined.sort(key=lambda x: x["timestamp"], reverse=True)
-
-    for item in combined:
-        with st.expander(f"{item['timestamp']} — {item['type']}"):
-            st.write(item["content"])
+    labels = {"log": "Health Log", "ocr": "OCR", "photo": "Photo", "audio": "Audio", "summary": "Summary"}
+    kinds = st.multiselect("Show", list(labels), default=list(labels), format_func=labels.get)
+
+    def title(item):
+        kind, x = item
+        name = x.get("filename") or x.get("file")
+        return f"{x.get('timestamp', '')} — {labels.get(kind, kind)}" + (f": {name}" if name else "")
+
+    def body(item):
+        kind, x = item
+        if kind == "log":
+            return x.get("notes") or x.get("text", "")
+        if kind in ("photo", "audio"):
+            return f"Stored as {x.get('stored_as') or x.get('file', '')}"
+        return x.get("text", "")
+
+    history_list(
+        "merged_list",
+        lambda cursor, limit, start, end: [
+            (pos, (kind, x)) for pos, kind, x in timeline.scan(limit, cursor, start, end, kinds)
+        ],
+        lambda start, end: timeline.count(start, end, kinds),
+        title=title,
+        body=body,
+    )
 
     aaa_footer()
 
@@ -412,39 +861,203 @@ def page_merged():
 # PAGE 8 — INSIGHTS AI
 # ============================================================
 
+def get_result_store(part=None):
+    part = part or current_partition()
+    return part.resource("results", lambda: ResultStore(part.results_file))
+
+
 def page_insights():
     aaa_header()
     st.subheader("📊 AI Pattern Insights")
+    part = current_partition()
 
-    logs = load_json(HEALTH_LOG_FILE, [])
-    ocr = load_json(OCR_DATA_FILE, [])
+    logs = load_json(part.log_file, [])
+    ocr = load_json(part.ocr_file, [])
 
     if not logs and not ocr:
         st.info("No data available yet.")
         aaa_footer()
         return
 
-    data = {"logs": logs, "ocr": ocr}
-
     if st.button("Generate Insights"):
-        prompt = f"""
-        You are an AI medical insights engine.
-        Analyze this data and find:
-        - Trends
-        - Risk patterns
-        - Correlations
-        - Anomalies
-        - Helpful next steps
-
-        DATA:
-        {json.dumps(data, indent=2)}
-        """
-
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
+        # Any button press reruns the script, which cancels the stream
+        st.button("⏹ Stop", key="insights_stop")
+        box = st.empty()
+        box.info("Analysing history…")
+
+        def on_text(text):
+            st.session_state["insights_partial"] = text
+            box.write(text + " ▌")
+
+        start = time.perf_counter()
+        try:
+            run = generate_insights(
+                get_client(INSIGHTS_MODEL), logs, ocr,
+                store=get_result_store(), on_text=on_text,
+            )
+        except ModelUnavailable as e:
+            box.empty()
+            st.error(str(e))
+            return
+        total = time.perf_counter() - start
+        box.empty()
+        st.session_state.pop("insights_partial", None)
 
         st.success("Insights generated.")
-        st.write(response.text)
+        ttft = f" • first token {run.ttft_ms / 1000:.2f}s" if run.ttft_ms is not None else ""
+        st.caption(
+            f"{run.chunks} period chunk(s) • {run.calls} model call(s) • "
+            f"{run.cached} reused from cache • ~{run.input_tokens:,} input tokens sent • "
+            f"{total:.1f}s total{ttft}"
+        )
+        st.write(run.text)
+
+    elif "insights_partial" in st.session_state:
+        st.warning("Generation stopped — partial output below.")
+        st.write(st.session_state.pop("insights_partial"))
+
+    aaa_footer()
+
+
+# ============================================================
+# PAGE 9 — SEARCH
+# ============================================================
+
+def page_search():
+    aaa_header()
+    st.subheader("🔎 Search Notes & OCR")
+    part = current_partition()
+
+    index = get_search_index()
+
+    if index.count() == 0 and (get_store().count(part.log_file) or get_store().count(part.ocr_file)):
+        st.info("The search index is empty — build it from the existing data first.")
+
+    c1, c2 = st.columns([4, 1])
+    with c1:
+        query = st.text_input("Search", placeholder="e.g. nexium, blood pressure, hba1c")
+    with c2:
+        kind = st.selectbox("In", ["All", "Health Log", "OCR"])
+
+    if query:
+        hits, ms = index.search(query, kind={"Health Log": "log", "OCR": "ocr"}.get(kind))
+        st.caption(f"{len(hits)} results in {ms:.1f} ms")
+
+        for h in hits:
+            if h["kind"] == "log":
+                label = f"{h['timestamp']} — Health Log ({h['title']})"
+            else:
+                label = f"{h['timestamp']} — OCR: {h['title']} • page {h['page']}"
+            st.markdown(f"**{label}**")
+            st.markdown(h["snippet"])
+            st.divider()
+
+    if st.button("♻️ Rebuild Search Index"):
+        index.rebuild(load_json(part.log_file, []), load_json(part.ocr_file, []))
+        st.success(f"Indexed {index.count()} documents.")
+
+    aaa_footer()
+
+
+# ============================================================
+# PAGE 10 — PERFORMANCE
+# ============================================================
+
+# Operation prefixes (see perf.span calls) grouped for the breakdown
+PERF_GROUPS = {
+    "storage": "File I/O", "json": "JSON", "pdf": "PDF render",
+    "model": "Model calls",
+}
+
+
+def perf_gauges():
+    # Point-in-time values exported next to the timings
+    locks = lock_stats()
+    store = get_store().stats()
+    gauges = {
+        "aaa_lock_acquired": locks["acquired"],
+        "aaa_lock_contended": locks["contended"],
+        "aaa_lock_wait_seconds": locks["wait_ms"] / 1000,
+        "aaa_store_cache_hits": store["hits"],
+        "aaa_store_cache_misses": store["misses"],
+    }
+    for status, n in get_job_queue().counts().items():
+        gauges[f"aaa_jobs_{status}"] = n
+    return gauges
+
+
+def describe_op(row):
+    labels = ", ".join(f"{k}={v}" for k, v in row["labels"].items())
+    return f"{row['op']} ({labels})" if labels else row["op"]
+
+
+def page_performance():
+    aaa_header()
+    st.subheader("⏱️ Performance")
+
+    windows = {"Last 5 minutes": 300, "Last hour": 3600, "Everything in the buffer": None}
+    window = st.radio("Percentiles over", list(windows), horizontal=True)
+    seconds = windows[window]
+    rows = perf.summary(since=time.time() - seconds if seconds else None)
+
+    if not rows:
+        st.info("No timings recorded yet — use the other pages first.")
+        aaa_footer()
+        return
+
+    # Every span except "page" is a leaf, so these sums don't overlap
+    totals, page_s = {}, 0.0
+    for r in rows:
+        if r["op"] == "page":
+            page_s += r["total_s"]
+            continue
+        group = PERF_GROUPS.get(r["op"].split(".")[0], "Other")
+        totals[group] = totals.get(group, 0.0) + r["total_s"]
+    if totals:
+        cols = st.columns(len(totals))
+        for col, (group, total) in zip(cols, sorted(totals.items(), key=lambda x: -x[1])):
+            col.metric(group, f"{total:.2f} s")
+    st.caption(f"Total time since start. Page runs took {page_s:.2f} s in all; that includes "
+               "the work above done on the script thread, plus Streamlit element calls. "
+               "Background jobs run outside page runs.")
+
+    logo = payload_report("logo", 150)
+    st.caption(
+        f"Header logo: {logo['after']} B per rerun (was {logo['before'] / 1e6:.2f} MB inline) • "
+        f"{logo['file_bytes'] / 1e3:.0f} KB cached file"
+    )
+
+    def ms(v):
+        return None if v is None else round(v, 2)
+
+    st.dataframe([
+        {"Operation": describe_op(r), "Calls": r["calls"], "Errors": r["errors"],
+         "p50 ms": ms(r["p50_ms"]), "p95 ms": ms(r["p95_ms"]), "p99 ms": ms(r["p99_ms"]),
+         "Total s": round(r["total_s"], 3), "MB": round(r["bytes"] / 1e6, 2)}
+        for r in rows
+    ], use_container_width=True, hide_index=True)
+
+    locks = lock_stats()
+    st.caption(
+        f"File locks: {locks['acquired']:,} acquired • {locks['contended']:,} contended "
+        f"({locks['contention_rate']:.0%}) • max wait {locks['max_wait_ms']:.0f} ms"
+    )
+    for c in client_stats():
+        st.caption(f"{c['model']} ({c['backend']}): {c['calls']} calls • {c['retried']} retried • "
+                   f"{c['failed']} failed • {c['throttled_s']:.1f}s rate-limited • breaker {c['breaker']}")
+
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        if st.button("📤 Export OpenMetrics"):
+            path = perf.export(gauges=perf_gauges())
+            st.success(f"Written to {path}")
+    with c2:
+        st.download_button("⬇️ Download metrics", perf.openmetrics(perf_gauges()),
+                           file_name="aaa_metrics.prom", mime="text/plain")
+    with c3:
+        if st.button("🧹 Reset timings"):
+            perf.reset()
+            st.rerun()
 
     aaa_footer()
 
@@ -453,6 +1066,32 @@ def page_insights():
 # NAVIGATION
 # ============================================================
 
+def profile_picker():
+    # Each profile is its own data partition (see partitions.py). There is
+    # no login, so this separates data but doesn't restrict who sees it.
+    profiles = list_partitions()
+    current = st.session_state.setdefault("partition", DEFAULT_PARTITION)
+    if current not in profiles:
+        profiles.append(current)
+
+    def pick():
+        st.session_state["partition"] = st.session_state["profile_choice"]
+
+    def create():
+        name = st.session_state["profile_new"].strip()
+        if name:
+            st.session_state["partition"] = get_partition(name).id
+            st.session_state.pop("profile_choice", None)
+        st.session_state["profile_new"] = ""
+
+    st.sidebar.selectbox("Profile", profiles, index=profiles.index(current),
+                         key="profile_choice", on_change=pick,
+                         help="Profiles keep data apart; they are not private. "
+                              "Anyone using this app can open any profile.")
+    st.sidebar.text_input("New profile", key="profile_new", placeholder="name or e-mail",
+                          on_change=create)
+
+
 def main():
     st.sidebar.title("💎 AAA — Health Intelligence")
 
@@ -465,10 +1104,28 @@ def main():
         "🧠 Summary AI": page_summary,
         "🔗 Merged View": page_merged,
         "📊 Insights AI": page_insights,
+        "🔎 Search": page_search,
+        "⏱️ Performance": page_performance,
     }
 
+    profile_picker()
     choice = st.sidebar.radio("Navigation", list(pages.keys()))
-    pages[choice]()
+    with perf.span("page", page=choice.split(" ", 1)[1]):
+        pages[choice]()
+
+    stats = get_store().stats()
+    st.sidebar.caption(
+        f"Data cache: {stats['hits']} hits • {stats['misses']} misses "
+        f"({stats['hit_rate']:.0%})"
+    )
+    jobs = get_job_queue().counts()
+    if jobs.get("queued") or jobs.get("running"):
+        st.sidebar.caption(f"Background jobs: {jobs.get('running', 0)} running • {jobs.get('queued', 0)} queued")
+    for c in client_stats():
+        if c["breaker"] != "closed" or c["throttled_s"]:
+            st.sidebar.caption(f"{c['model']}: breaker {c['breaker']} • {c['throttled_s']:.0f}s rate-limited")
+
+    perf.export_if_due(gauges=perf_gauges)
 
 
 # ============================================================
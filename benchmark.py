@@ -0,0 +1,552 @@
+# ============================================================
+# AAA — BENCHMARK SUITE
+# SYNTHETIC DATA • STORAGE / MERGE / SNAPSHOT / OCR • JSON RESULTS
+# ============================================================
+#
+#   python benchmark.py --records 1000,100000 --pages 1,50 --out bench.json
+#   python benchmark.py --compare bench.json          # after a change
+#
+# Generates synthetic health logs and OCR results (--records, 1k–1M) and
+# multi-page documents (--pages, 1–500), then runs the app's own code paths
+# against them:
+#
+#   storage    save_json, cold load_json, cached DataStore.load, append_json,
+#              first history page (scan) and count
+#   merge      the Merged View's timeline index: build, re-sync when nothing
+#              changed, first page, a page deep into the history, a filtered
+#              page and count (date range + one kind); and
+#              merge_health_data.merge into JSON Lines
+#   snapshot   first snapshot, an incremental one after 1% new records, load
+#   ocr        PDF render (PyMuPDF, when installed), image preprocessing and
+#              the concurrent OCR pipeline through a ModelClient backed by
+#              the offline StubModel; then the same document from the cache
+#   startup    app.py's import block in a fresh interpreter (cold start);
+#              the per-rerun cost of setting up the model client, as it was
+#              (st.secrets + genai.configure on every rerun) and as it is
+#              (a st.cache_resource hit), --reruns times each; plus the cold
+#              import time of each heavy library the app loads lazily, i.e.
+#              what a page that doesn't use it no longer pays
+#
+# Each (suite, size) case runs in a fresh process, so its peak memory (max
+# RSS) is its own. Operations timed repeatedly report latency percentiles;
+# throughput is records (or pages) per second. Results are written as JSON;
+# --compare prints the change against an earlier results file and exits
+# non-zero when something got slower by more than --threshold.
+
+import argparse
+import ast
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+SUITES = ("storage", "merge", "snapshot", "ocr", "startup")
+SAMPLES = 200          # repetitions for per-operation latencies
+PAGE_SIZE = 25         # history page size used by the app
+STUB_LATENCY = 0.02    # seconds per fake model call
+COLD_STARTS = 5        # fresh interpreters per cold-start measurement
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_FILE = os.path.join(APP_DIR, "app.py")
+LAZY_MODULES = ("google.generativeai", "fitz", "PIL.Image")
+
+WORDS = ("headache fatigue nausea dizziness fever cough rash insomnia appetite "
+         "pain joint stomach blood pressure glucose medication dose morning evening "
+         "mild severe improved worse stable slept walked ate water").split()
+
+
+# ============================================================
+# SYNTHETIC DATA
+# ============================================================
+
+def _text(rng, n_words):
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+def make_log(n, seed=1, start=datetime(2020, 1, 1)):
+    # n health log entries, one every ~17 minutes, in timestamp order
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        t = start + timedelta(seconds=i * 1000 + rng.randrange(600))
+        out.append({"timestamp": t.strftime("%Y-%m-%d %H:%M:%S"),
+                    "date": t.strftime("%Y-%m-%d"),
+                    "notes": _text(rng, rng.randint(5, 40))})
+    return out
+
+
+def make_ocr(n, seed=2, start=datetime(2020, 1, 1)):
+    # n OCR results (interleaved with the log by timestamp), 1–3 pages each
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        t = start + timedelta(seconds=i * 1000 + rng.randrange(1000))
+        pages = rng.randint(1, 3)
+        text = "".join(f"\n\n--- PAGE {p} ---\n{_text(rng, 60)}" for p in range(1, pages + 1))
+        out.append({"timestamp": t.strftime("%Y-%m-%d %H:%M:%S"),
+                    "filename": f"report_{i}.pdf", "text": text})
+    return out
+
+
+def make_page_images(n, seed=3):
+    # n distinct page-like PNGs (A4 at 150 dpi, grayscale text lines)
+    from PIL import Image, ImageDraw
+    rng = random.Random(seed)
+    images = []
+    for p in range(n):
+        img = Image.new("L", (1240, 1754), 255)
+        draw = ImageDraw.Draw(img)
+        draw.text((80, 60), f"Page {p + 1}", fill=0)
+        for line in range(60):
+            draw.text((80, 110 + line * 26), _text(rng, 12), fill=0)
+        buf = io.BytesIO()
+        img.save(buf, "PNG")
+        images.append(buf.getvalue())
+    return images
+
+
+def make_pdf(path, images):
+    # Scanned-style PDF: each page is one of `images`, no text layer
+    doc = fitz.open()
+    for data in images:
+        page = doc.new_page(width=595, height=842)
+        page.insert_image(page.rect, stream=data)
+    doc.save(path)
+    doc.close()
+
+
+# ============================================================
+# MEASUREMENT
+# ============================================================
+
+def percentiles(samples_s):
+    # Latency summary in milliseconds
+    ms = sorted(s * 1000 for s in samples_s)
+    if not ms:
+        return {}
+
+    def pick(q):
+        return ms[min(len(ms) - 1, int(q * len(ms)))]
+
+    return {"n": len(ms), "mean_ms": sum(ms) / len(ms), "p50_ms": pick(0.50),
+            "p90_ms": pick(0.90), "p99_ms": pick(0.99), "max_ms": ms[-1]}
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def repeat(fn, n=SAMPLES):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples)
+
+
+def once(seconds, items):
+    return {"seconds": seconds, "per_s": items / seconds if seconds else 0.0}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / (1024 * 1024) if sys.platform == "darwin" else kb / 1024
+
+
+# ============================================================
+# SUITES — each returns {operation: metrics}
+# ============================================================
+
+def bench_storage(n, work):
+    import storage
+    log_path = os.path.join(work, "health_log.json")
+    records = make_log(n)
+    store = storage.DataStore()
+
+    seconds, _ = timed(storage.save_json, log_path, records)
+    out = {"save_json": once(seconds, n)}
+    seconds, _ = timed(storage.load_json, log_path, [])
+    out["load_json_cold"] = once(seconds, n)
+    store.load(log_path, [])
+    out["datastore_load_cached"] = repeat(lambda: store.load(log_path, []), 20)
+
+    extra = iter(make_log(SAMPLES, seed=9, start=datetime(2030, 1, 1)))
+    out["append_json"] = repeat(lambda: store.append(log_path, next(extra)))
+    out["history_first_page"] = repeat(lambda: store.scan(log_path, PAGE_SIZE))
+    out["history_count_range"] = repeat(
+        lambda: store.count(log_path, "2020-06-01", "2020-07-01"), 20)
+    out["file_mb"] = os.path.getsize(log_path) / 1e6
+    return out
+
+
+def bench_merge(n, work):
+    import storage
+    import merge_health_data
+    from timeline import TimelineIndex
+
+    log_path = os.path.join(work, "health_log.json")
+    ocr_path = os.path.join(work, "ocr_results.json")
+    storage.save_json(log_path, make_log(n // 2))
+    storage.save_json(ocr_path, make_ocr(n - n // 2))
+    store = storage.DataStore()
+    store.load(log_path, [])
+    store.load(ocr_path, [])
+
+    out = {}
+    timeline = TimelineIndex(os.path.join(work, "timeline.db"))
+
+    def build():
+        timeline.sync_source(log_path, "log", store.load(log_path, []))
+        timeline.sync_source(ocr_path, "ocr", store.load(ocr_path, []))
+
+    seconds, _ = timed(build)
+    out["timeline_build"] = once(seconds, n)
+    out["timeline_first_page"] = repeat(lambda: timeline.scan(PAGE_SIZE))
+    cursor = timeline.scan(n // 2)[-1][0] if n > 1 else None
+    out["timeline_deep_page"] = repeat(lambda: timeline.scan(PAGE_SIZE, cursor))
+    # What page_merged runs with a date range and one kind selected
+    out["timeline_filtered_page"] = repeat(
+        lambda: timeline.scan(PAGE_SIZE, None, "2020-06-01", "2020-07-01", ["ocr"]))
+    out["timeline_filtered_count"] = repeat(
+        lambda: timeline.count("2020-06-01", "2020-07-01", ["ocr"]))
+    seconds, _ = timed(build)
+    out["timeline_resync_unchanged"] = once(seconds, n)
+
+    with open(os.devnull, "w") as null:
+        seconds, _ = timed(merge_health_data.merge, [("log", log_path), ("ocr", ocr_path)],
+                           os.path.join(work, "merged.jsonl"), log=null)
+    out["merge_cli"] = once(seconds, n)
+    return out
+
+
+def bench_snapshot(n, work):
+    from snapshots import SnapshotStore
+    snaps = SnapshotStore(os.path.join(work, "snapshots"))
+    data = {"health_log": make_log(n // 2), "ocr": make_ocr(n - n // 2)}
+
+    seconds, first = timed(snaps.create, "first.json", "2030-01-01 00:00:00", data)
+    out = {"create_first": once(seconds, n)}
+
+    grow = max(1, n // 100)
+    data = {"health_log": data["health_log"] + make_log(grow, seed=7, start=datetime(2030, 1, 1)),
+            "ocr": data["ocr"]}
+    seconds, second = timed(snaps.create, "second.json", "2030-01-02 00:00:00", data)
+    out["create_incremental"] = once(seconds, n + grow)
+    out["create_incremental"]["new_bytes"] = second["new_bytes"]
+
+    seconds, _ = timed(snaps.load, "second.json")
+    out["load"] = once(seconds, n + grow)
+    out["disk_mb"] = snaps.disk_usage() / 1e6
+    return out
+
+
+def bench_ocr(pages, work):
+    from image_prep import preprocess_pages, PrepReport, PDF_DPI
+    from model_client import ModelClient, RateLimiter, StubModel
+    from ocr_cache import OcrCache
+    from ocr_pipeline import run_ocr, OCR_MODEL
+
+    images = make_page_images(pages)
+    out = {}
+
+    if fitz is not None:
+        pdf = os.path.join(work, "scan.pdf")
+        make_pdf(pdf, images)
+        matrix = fitz.Matrix(PDF_DPI / 72, PDF_DPI / 72)
+        with fitz.open(pdf) as doc:
+            seconds, images = timed(lambda: [
+                doc[i].get_pixmap(matrix=matrix, colorspace=fitz.csGRAY).tobytes("png")
+                for i in range(len(doc))])
+        out["pdf_render"] = once(seconds, pages)
+    else:
+        out["pdf_render"] = {"skipped": "PyMuPDF not installed — synthetic page images used"}
+
+    report = PrepReport()
+    seconds, prepared = timed(lambda: list(preprocess_pages(enumerate(images, 1), report=report)))
+    out["preprocess"] = once(seconds, pages)
+    out["preprocess"].update(report.as_dict())
+
+    # No rate limit: this measures the pipeline, not the quota
+    model = ModelClient(OCR_MODEL, StubModel(OCR_MODEL, latency=STUB_LATENCY),
+                        limiter=RateLimiter(rpm=10 ** 9, tpm=10 ** 12))
+    cache = OcrCache(os.path.join(work, "ocr_cache.db"))
+
+    for label in ("ocr_pipeline", "ocr_pipeline_cached"):
+        queued, latencies = {}, []
+
+        def progress(page_no, state, done, total):
+            # Queued → answered by the model; cache hits never queue
+            if state == "queued":
+                queued[page_no] = time.perf_counter()
+            elif state == "done":
+                latencies.append(time.perf_counter() - queued[page_no])
+
+        seconds, _ = timed(run_ocr, iter(prepared), model, total=pages, retries=0,
+                           on_progress=progress, cache=cache)
+        out[label] = once(seconds, pages)
+        out[label]["page_latency"] = percentiles(latencies)
+    out["model_calls"] = model.calls
+    return out
+
+
+def _installed(module):
+    try:
+        return importlib.util.find_spec(module) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+def app_import_block():
+    # app.py's top-level import statements as source, minus packages that
+    # aren't installed here (reported as skipped)
+    with open(APP_FILE, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    lines, skipped = [], []
+    for node in tree.body:
+        if not isinstance(node, (ast.Import, ast.ImportFrom)):
+            continue
+        root = (node.module if isinstance(node, ast.ImportFrom) else node.names[0].name).split(".")[0]
+        if not _installed(root):
+            skipped.append(root)
+        else:
+            lines.append(ast.unparse(node))
+    return "\n".join(lines), skipped
+
+
+# Runs in a fresh interpreter: times the block once cold and lists which
+# lazily loaded libraries ended up imported
+STARTUP_PROBE = '''
+import json, sys, time
+block = compile(sys.stdin.read(), "app.py", "exec")
+start = time.perf_counter()
+exec(block, {})
+cold = time.perf_counter() - start
+print(json.dumps({"cold": cold, "loaded": [m for m in sys.argv[1:] if m in sys.modules]}))
+'''
+
+# Model set-up as each Streamlit rerun paid it before (secrets lookup and
+# genai.configure at the top of app.py) and after (app.py's cached
+# configure_model_backend). The first call of each is untimed, so only the
+# steady per-rerun cost is compared.
+CONFIGURE_PROBE = '''
+import json, sys, time
+import streamlit as st
+from google import generativeai as genai
+
+def every_rerun():
+    genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+
+@st.cache_resource
+def once_per_process():
+    genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+
+def sample(fn, n):
+    fn()
+    out = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - start)
+    return out
+
+n = int(sys.argv[1])
+print(json.dumps({"before": sample(every_rerun, n), "after": sample(once_per_process, n)}))
+'''
+
+
+def _probe(source, lazy=LAZY_MODULES):
+    out = subprocess.run([sys.executable, "-c", STARTUP_PROBE, *lazy],
+                         input=source, capture_output=True, text=True, cwd=APP_DIR)
+    if out.returncode:
+        raise RuntimeError(f"import probe failed: {out.stderr.strip().splitlines()[-1]}")
+    return json.loads(out.stdout)
+
+
+def bench_configure(reruns, work):
+    # {"before": [...], "after": [...]} seconds, with a dummy key in a
+    # throwaway secrets.toml (configure makes no network call)
+    os.makedirs(os.path.join(work, ".streamlit"), exist_ok=True)
+    with open(os.path.join(work, ".streamlit", "secrets.toml"), "w") as f:
+        f.write('GEMINI_API_KEY = "benchmark-dummy-key"\n')
+    out = subprocess.run([sys.executable, "-c", CONFIGURE_PROBE, str(reruns)],
+                         capture_output=True, text=True, cwd=work)
+    if out.returncode:
+        raise RuntimeError(f"configure probe failed: {out.stderr.strip().splitlines()[-1]}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def bench_startup(reruns, work):
+    block, skipped = app_import_block()
+    runs = [_probe(block) for _ in range(COLD_STARTS)]
+
+    out = {"app_imports_cold": percentiles([r["cold"] for r in runs]),
+           "lazy_modules_loaded_at_start": len(runs[0]["loaded"])}
+    if skipped:
+        out["app_imports_not_installed"] = ", ".join(sorted(set(skipped)))
+
+    missing = [m for m in ("streamlit", "google.generativeai") if not _installed(m)]
+    if missing:
+        skip = {"skipped": f"{', '.join(missing)} not installed"}
+        out["model_setup_per_rerun_before"] = out["model_setup_per_rerun_after"] = skip
+    else:
+        samples = bench_configure(reruns, work)
+        out["model_setup_per_rerun_before"] = percentiles(samples["before"])
+        out["model_setup_per_rerun_after"] = percentiles(samples["after"])
+
+    # What each lazily loaded library costs the first page that needs it
+    for module in LAZY_MODULES:
+        if not _installed(module):
+            out[f"import_{module}"] = {"skipped": f"{module} not installed"}
+            continue
+        samples = [_probe(f"import {module}", ())["cold"] for _ in range(COLD_STARTS)]
+        out[f"import_{module}"] = percentiles(samples)
+    return out
+
+
+BENCHES = {"storage": bench_storage, "merge": bench_merge,
+           "snapshot": bench_snapshot, "ocr": bench_ocr, "startup": bench_startup}
+
+
+def run_case(suite, size):
+    # Runs in its own process
+    work = tempfile.mkdtemp(prefix=f"aaa_bench_{suite}_")
+    try:
+        start = time.perf_counter()
+        metrics = BENCHES[suite](size, work)
+        return {"suite": suite, "size": size, "seconds": time.perf_counter() - start,
+                "peak_rss_mb": peak_rss_mb(), "metrics": metrics}
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+# ============================================================
+# REPORTING
+# ============================================================
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "commit": commit,
+            "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "pymupdf": fitz is not None}
+
+
+def headline(metrics):
+    # One comparable number per operation: p50 latency or total seconds
+    out = {}
+    for op, m in metrics.items():
+        if isinstance(m, dict) and "p50_ms" in m:
+            out[op] = m["p50_ms"] / 1000
+        elif isinstance(m, dict) and "seconds" in m:
+            out[op] = m["seconds"]
+    return out
+
+
+def print_case(case):
+    print(f"\n■ {case['suite']} @ {case['size']:,} — {case['seconds']:.2f}s, "
+          f"peak RSS {case['peak_rss_mb'] or 0:.0f} MB")
+    for op, m in case["metrics"].items():
+        if isinstance(m, str):
+            print(f"    {op:<28} {m}")
+        elif not isinstance(m, dict):
+            print(f"    {op:<28} {m:,}" if isinstance(m, int) else f"    {op:<28} {m:,.2f}")
+        elif "skipped" in m:
+            print(f"    {op:<28} skipped ({m['skipped']})")
+        elif "p50_ms" in m:
+            print(f"    {op:<28} p50 {m['p50_ms']:8.2f} ms  p90 {m['p90_ms']:8.2f}  "
+                  f"p99 {m['p99_ms']:8.2f}  max {m['max_ms']:8.2f}")
+        else:
+            extra = m.get("page_latency")
+            tail = f"  page p50 {extra['p50_ms']:.1f} ms p99 {extra['p99_ms']:.1f}" if extra else ""
+            print(f"    {op:<28} {m['seconds']:8.3f} s  {m['per_s']:12,.0f}/s{tail}")
+
+
+def compare(results, baseline, threshold):
+    # Prints per-operation change vs. baseline; returns the regressions
+    old = {(c["suite"], c["size"]): headline(c["metrics"]) for c in baseline["cases"]}
+    regressions = []
+    print(f"\nCompared with {baseline['environment'].get('commit') or 'baseline'} "
+          f"({baseline['environment']['timestamp']}):")
+    for case in results["cases"]:
+        before = old.get((case["suite"], case["size"]))
+        if before is None:
+            continue
+        for op, now in headline(case["metrics"]).items():
+            if op not in before or not before[op]:
+                continue
+            change = now / before[op] - 1
+            flag = "✖" if change > threshold else "✔"
+            print(f"  {flag} {case['suite']:<8} {case['size']:>9,} {op:<28} {change:+7.1%}")
+            if change > threshold:
+                regressions.append((case["suite"], case["size"], op, change))
+    return regressions
+
+
+def sizes(value):
+    return [int(float(v)) for v in value.split(",") if v.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AAA performance benchmarks")
+    parser.add_argument("--suites", default=",".join(SUITES), help="comma-separated subset of " + ", ".join(SUITES))
+    parser.add_argument("--records", type=sizes, default=[1000, 10000],
+                        help="record counts for storage/merge/snapshot (e.g. 1000,100000,1e6)")
+    parser.add_argument("--pages", type=sizes, default=[1, 20], help="page counts for ocr (1–500)")
+    parser.add_argument("--reruns", type=int, default=50, help="reruns timed by the startup model set-up comparison")
+    parser.add_argument("--out", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="RESULTS_JSON", help="earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="slowdown counted as a regression by --compare (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    per_suite = {"ocr": args.pages, "startup": [args.reruns]}
+    cases = [(s, n) for s in args.suites.split(",") for n in per_suite.get(s, args.records)]
+    unknown = {s for s, _ in cases} - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suite(s): {', '.join(sorted(unknown))}")
+
+    ctx = multiprocessing.get_context("spawn")
+    results = {"environment": environment(), "cases": []}
+    for suite, size in cases:
+        with ctx.Pool(1) as pool:
+            case = pool.apply(run_case, (suite, size))
+        results["cases"].append(case)
+        print_case(case)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n✔ Results written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        if regressions:
+            print(f"\n✖ {len(regressions)} operation(s) slower than +{args.threshold:.0%}")
+            sys.exit(1)
@@ -0,0 +1,3 @@
+# test_gemini_ok.py is a manual check against the live Gemini API (it needs
+# google-generativeai and a key, and makes network calls), not a unit test
+collect_ignore = ["test_gemini_ok.py"]
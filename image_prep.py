@@ -0,0 +1,93 @@
+# ============================================================
+# AAA — OCR IMAGE PREPROCESSING
+# EXIF ORIENTATION • DOWNSCALE • GRAYSCALE / CONTRAST • RE-ENCODE
+# ============================================================
+#
+# Phone photos arrive as multi-megabyte, often sideways JPEGs. The model
+# reads text just as well from a grayscale, contrast-stretched image whose
+# long side is PREP_MAX_DIM pixels, and that image is a fraction of the
+# size to upload. PDF pages are rasterised at PDF_DPI in grayscale directly.
+#
+# Preprocessing is deterministic, so the OCR cache keeps working: the same
+# upload with the same settings always produces the same bytes. If the
+# processed image would be larger than the original (a small, clean PNG),
+# the original is sent instead.
+#
+# Pillow is imported on the first preprocess() call.
+
+import io
+import os
+import time
+
+PREP_MAX_DIM = int(os.environ.get("AAA_OCR_MAX_DIM", "2048"))
+PREP_FORMAT = os.environ.get("AAA_OCR_FORMAT", "JPEG").upper()   # JPEG, WEBP or PNG
+PREP_QUALITY = 85
+PDF_DPI = int(os.environ.get("AAA_PDF_DPI", "150"))
+UPLINK_MBPS = float(os.environ.get("AAA_UPLINK_MBPS", "2"))      # for "upload time saved"
+
+
+def prep_signature(max_dim=PREP_MAX_DIM, fmt=PREP_FORMAT, quality=PREP_QUALITY, dpi=PDF_DPI):
+    # Changes whenever the settings change the bytes sent to the model
+    return f"prep:{max_dim}:{fmt}:{quality}:{dpi}"
+
+
+class PrepReport:
+    # Running totals for one document
+    def __init__(self):
+        self.images = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.prep_ms = 0.0
+
+    def add(self, bytes_in, bytes_out, ms):
+        self.images += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+        self.prep_ms += ms
+
+    @property
+    def bytes_saved(self):
+        return self.bytes_in - self.bytes_out
+
+    @property
+    def upload_s_saved(self):
+        return self.bytes_saved * 8 / (UPLINK_MBPS * 1e6)
+
+    def as_dict(self):
+        return {"images": self.images, "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+                "bytes_saved": self.bytes_saved, "upload_s_saved": self.upload_s_saved,
+                "prep_ms": self.prep_ms}
+
+
+def preprocess(image_bytes, max_dim=PREP_MAX_DIM, fmt=PREP_FORMAT, quality=PREP_QUALITY,
+               report=None):
+    # Returns the bytes to send to the model (never larger than the input)
+    from PIL import Image, ImageOps
+
+    start = time.perf_counter()
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("L")
+        if max(img.size) > max_dim:
+            img.thumbnail((max_dim, max_dim), Image.LANCZOS)
+        img = ImageOps.autocontrast(img, cutoff=1)
+
+        buf = io.BytesIO()
+        if fmt == "PNG":
+            img.save(buf, "PNG", optimize=True)
+        else:
+            img.save(buf, fmt, quality=quality, optimize=True)
+        out = buf.getvalue()
+
+    if len(out) >= len(image_bytes):
+        out = image_bytes
+
+    if report is not None:
+        report.add(len(image_bytes), len(out), (time.perf_counter() - start) * 1000)
+    return out
+
+
+def preprocess_pages(pages, report=None, **kwargs):
+    # Wraps a (page_no, image_bytes) iterator; stays lazy
+    for page_no, image_bytes in pages:
+        yield page_no, preprocess(image_bytes, report=report, **kwargs)
@@ -0,0 +1,253 @@
+# ============================================================
+# AAA — INSIGHTS CONTEXT BUILDER
+# TOKEN BUDGETS • TIME-WINDOWED CHUNKS • CONCURRENT MAP-REDUCE
+# ============================================================
+#
+# Records are flattened to one compact line each (no JSON indentation, no
+# repeated keys, redundant fields dropped) and packed into chunks of whole
+# calendar months up to CHUNK_TOKENS. If everything fits in one chunk the
+# model sees it in a single call. Otherwise each chunk is analysed
+# concurrently (map) and the per-period findings are merged (reduce).
+#
+# Chunk boundaries only depend on the records before them, so adding a new
+# entry changes the last chunk alone; every other chunk's analysis comes
+# straight from the ResultStore.
+#
+# Pass on_text to stream the final answer (the single call, or the last
+# reduce) as it is generated.
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_results import result_key, response_tokens
+from ai_stream import stream_generate
+
+INSIGHTS_MODEL = "gemini-2.0-flash"
+PROMPT_VERSION = "insights-v2"
+
+CHUNK_TOKENS = 60_000     # per map call
+REDUCE_TOKENS = 60_000    # per reduce call
+MAP_CONCURRENCY = 4
+
+FULL_PROMPT = """
+You are an AI medical insights engine.
+Analyze this data and find:
+- Trends
+- Risk patterns
+- Correlations
+- Anomalies
+- Helpful next steps
+
+DATA (one record per line: timestamp | type | content):
+{data}
+"""
+
+MAP_PROMPT = """
+You are an AI medical insights engine reviewing ONE period ({period}) of a
+longer patient history. List concisely, as bullet points:
+- Symptoms and observations
+- Lab values / medications mentioned (with dates)
+- Risk markers and anomalies
+Do not write an introduction or next steps.
+
+DATA (one record per line: timestamp | type | content):
+{data}
+"""
+
+REDUCE_PROMPT = """
+You are an AI medical insights engine. Below are findings extracted from
+consecutive periods of one patient's history, oldest first.
+Combine them and find:
+- Trends
+- Risk patterns
+- Correlations
+- Anomalies
+- Helpful next steps
+
+FINDINGS:
+{data}
+"""
+
+_WS = re.compile(r"\s+")
+
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text; good enough for budgeting
+    return len(text) // 4 + 1
+
+
+# ============================================================
+# CONTEXT BUILDING
+# ============================================================
+
+def compact_lines(logs, ocr):
+    # (timestamp, line) pairs, oldest first. Drops empty records, a log's
+    # date when it matches its timestamp, and collapses whitespace.
+    rows = []
+    for x in logs:
+        notes = _WS.sub(" ", x.get("notes", "")).strip()
+        if not notes:
+            continue
+        ts = x.get("timestamp", "")
+        date = x.get("date", "")
+        label = "log" if not date or ts.startswith(date) else f"log for {date}"
+        rows.append((ts, f"{ts} | {label} | {notes}"))
+
+    for x in ocr:
+        text = _WS.sub(" ", x.get("text", "")).strip()
+        if not text:
+            continue
+        ts = x.get("timestamp", "")
+        rows.append((ts, f"{ts} | ocr {x.get('filename', '')} | {text}"))
+
+    rows.sort(key=lambda r: r[0])
+    return rows
+
+
+def _split_line(line, budget):
+    # A single record bigger than a chunk (a very long OCR) is cut in pieces
+    size = budget * 4
+    return [line[i:i + size] for i in range(0, len(line), size)]
+
+
+def build_chunks(rows, budget=CHUNK_TOKENS):
+    # Greedily pack whole months into chunks of at most `budget` tokens;
+    # returns [(period_label, text)]
+    months = []
+    for ts, line in rows:
+        month = ts[:7] or "undated"
+        if not months or months[-1][0] != month:
+            months.append((month, []))
+        months[-1][1].append(line)
+
+    chunks = []
+    cur_periods, cur_lines, cur_tokens = [], [], 0
+
+    def flush():
+        nonlocal cur_periods, cur_lines, cur_tokens
+        if cur_lines:
+            label = cur_periods[0] if len(cur_periods) == 1 else f"{cur_periods[0]} to {cur_periods[-1]}"
+            chunks.append((label, "\n".join(cur_lines)))
+        cur_periods, cur_lines, cur_tokens = [], [], 0
+
+    for month, lines in months:
+        month_tokens = sum(estimate_tokens(l) for l in lines)
+        if cur_tokens + month_tokens > budget:
+            flush()
+
+        for line in lines:
+            for piece in _split_line(line, budget):
+                t = estimate_tokens(piece)
+                if cur_tokens + t > budget:
+                    flush()
+                if not cur_periods or cur_periods[-1] != month:
+                    cur_periods.append(month)
+                cur_lines.append(piece)
+                cur_tokens += t
+
+    flush()
+    return chunks
+
+
+# ============================================================
+# MAP-REDUCE
+# ============================================================
+
+class InsightsRun:
+    def __init__(self):
+        self.text = ""
+        self.chunks = 0
+        self.cached = 0
+        self.calls = 0
+        self.input_tokens = 0
+        self.ttft_ms = None
+        self._lock = threading.Lock()
+
+    def count(self, field, n=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+
+def _call(model, prompt, run, on_text=None):
+    # Returns (text, latency_ms, input_tokens, output_tokens, ttft_ms)
+    if on_text is not None:
+        streamed = stream_generate(model, prompt, on_text)
+        text, latency, ttft = streamed.text, streamed.total_ms, streamed.ttft_ms
+        tin, tout = streamed.input_tokens, streamed.output_tokens
+        run.ttft_ms = ttft
+    else:
+        start = time.perf_counter()
+        response = model.generate_content(prompt)
+        latency = (time.perf_counter() - start) * 1000
+        text, ttft = response.text, None
+        tin, tout = response_tokens(response)
+
+    run.count("calls")
+    run.count("input_tokens", tin if tin is not None else estimate_tokens(prompt))
+    return text, latency, tin, tout, ttft
+
+
+def _cached_call(model, prompt, kind, store, model_name, run, on_text=None):
+    key = result_key(kind, model_name, PROMPT_VERSION, prompt)
+    if store is not None:
+        text = store.get(key)
+        if text is not None:
+            run.count("cached")
+            if on_text is not None:
+                on_text(text)
+            return text
+    text, latency, tin, tout, ttft = _call(model, prompt, run, on_text)
+    if store is not None:
+        store.put(key, kind, model_name, text, latency, tin, tout, ttft)
+    return text
+
+
+def _reduce(model, findings, store, model_name, run, on_text=None):
+    # Merge findings; if they overflow one call, reduce in groups of at
+    # least two first (so every level at least halves the count)
+    text = "\n\n".join(findings)
+    if estimate_tokens(text) <= REDUCE_TOKENS or len(findings) <= 2:
+        return _cached_call(model, REDUCE_PROMPT.format(data=text), "insights-reduce",
+                            store, model_name, run, on_text)
+
+    groups, cur, cur_tokens = [], [], 0
+    for f in findings:
+        t = estimate_tokens(f)
+        if len(cur) >= 2 and cur_tokens + t > REDUCE_TOKENS:
+            groups.append(cur)
+            cur, cur_tokens = [], 0
+        cur.append(f)
+        cur_tokens += t
+    groups.append(cur)
+
+    merged = [_reduce(model, g, store, model_name, run) if len(g) > 1 else g[0] for g in groups]
+    return _reduce(model, merged, store, model_name, run, on_text)
+
+
+def generate_insights(model, logs, ocr, store=None, model_name=INSIGHTS_MODEL,
+                      budget=CHUNK_TOKENS, concurrency=MAP_CONCURRENCY, on_text=None):
+    run = InsightsRun()
+    chunks = build_chunks(compact_lines(logs, ocr), budget)
+    run.chunks = len(chunks)
+
+    if not chunks:
+        return run
+
+    if len(chunks) == 1:
+        run.text = _cached_call(model, FULL_PROMPT.format(data=chunks[0][1]), "insights",
+                                store, model_name, run, on_text)
+        return run
+
+    def analyse(chunk):
+        period, text = chunk
+        findings = _cached_call(model, MAP_PROMPT.format(period=period, data=text),
+                                "insights-map", store, model_name, run)
+        return f"## {period}\n{findings}"
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="insights") as pool:
+        findings = list(pool.map(analyse, chunks))
+
+    run.text = _reduce(model, findings, store, model_name, run, on_text)
+    return run
@@ -0,0 +1,229 @@
+# ============================================================
+# AAA — BACKGROUND JOB QUEUE
+# SQLITE-BACKED • WORKER POOL • PRIORITIES • DEDUP BY INPUT HASH
+# ============================================================
+#
+# Long model work (OCR of a 50-page PDF, AI summaries) is submitted here
+# instead of running in the Streamlit script thread, so reruns, navigation
+# and other sessions don't kill or block it. Jobs live in SQLite and may be
+# shared by several app processes. Pages poll get() for status, progress
+# and the result.
+#
+# A running job carries its owner (one id per JobQueue) and a heartbeat
+# the owner refreshes every HEARTBEAT_SECONDS. A job whose heartbeat is
+# older than STALE_SECONDS belonged to a process that died, and is queued
+# again; jobs that a live process is still running are left alone.
+#
+# Submitting a dedup key that already has a queued or running job returns
+# that job, so two sessions uploading the same document share one run.
+# Finished jobs are not reused: repeating work is cheap (the OCR cache and
+# the AI result store answer it), and it has to re-create the records the
+# job writes. A failed job is re-run with retry().
+
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+
+import sqlite_util
+
+JOBS_FILE = "jobs.db"
+JOB_WORKERS = int(os.environ.get("AAA_JOB_WORKERS", "2"))
+POLL_INTERVAL = 0.5
+HEARTBEAT_SECONDS = 10.0
+STALE_SECONDS = 60.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id        INTEGER PRIMARY KEY,
+    kind      TEXT NOT NULL,
+    dedup_key TEXT,
+    priority  INTEGER NOT NULL DEFAULT 0,
+    status    TEXT NOT NULL DEFAULT 'queued',
+    progress  REAL NOT NULL DEFAULT 0,
+    message   TEXT NOT NULL DEFAULT '',
+    payload   TEXT NOT NULL,
+    result    TEXT,
+    error     TEXT,
+    attempts  INTEGER NOT NULL DEFAULT 0,
+    created   REAL NOT NULL,
+    started   REAL,
+    finished  REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(status, priority DESC, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_dedup ON jobs(dedup_key);
+"""
+
+# Columns added after the first release of the table
+EXTRA_COLUMNS = {
+    "owner": "TEXT",
+    "heartbeat": "REAL",
+}
+
+COLUMNS = ("id", "kind", "dedup_key", "priority", "status", "progress", "message",
+           "payload", "result", "error", "attempts", "created", "started", "finished",
+           "owner", "heartbeat")
+
+
+def _row_to_job(row):
+    job = dict(zip(COLUMNS, row))
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+class JobQueue:
+    def __init__(self, handlers, db_path=JOBS_FILE, workers=JOB_WORKERS):
+        # handlers: {kind: fn(payload, progress) -> JSON-able result}
+        # progress(fraction, message) may be called any number of times
+        self.handlers = handlers
+        self.db_path = db_path
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._conn = sqlite_util.LocalConnection(self.db_path, isolation_level=None)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        have = {r[1] for r in conn.execute("PRAGMA table_info(jobs)")}
+        for col, decl in EXTRA_COLUMNS.items():
+            if col not in have:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {col} {decl}")
+
+        self.workers = [
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            for i in range(max(1, workers))
+        ]
+        self.workers.append(threading.Thread(target=self._beat, name="job-heartbeat", daemon=True))
+        for t in self.workers:
+            t.start()
+
+    # ---------- producer side ----------
+
+    def submit(self, kind, payload, priority=0, dedup_key=None):
+        if kind not in self.handlers:
+            raise ValueError(f"No handler for job kind {kind!r}")
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if dedup_key:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE dedup_key = ? AND kind = ? "
+                    "AND status IN ('queued', 'running') ORDER BY id DESC LIMIT 1",
+                    (dedup_key, kind),
+                ).fetchone()
+                if row:
+                    conn.execute("COMMIT")
+                    return row[0]
+
+            cur = conn.execute(
+                "INSERT INTO jobs (kind, dedup_key, priority, payload, created) VALUES (?, ?, ?, ?, ?)",
+                (kind, dedup_key, priority, json.dumps(payload), time.time()),
+            )
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+
+        self._wake.set()
+        return cur.lastrowid
+
+    def get(self, job_id):
+        row = self._conn().execute(
+            f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return _row_to_job(row) if row else None
+
+    def list(self, limit=50, status=None):
+        sql = f"SELECT {', '.join(COLUMNS)} FROM jobs"
+        args = []
+        if status:
+            sql += " WHERE status = ?"
+            args.append(status)
+        sql += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+        return [_row_to_job(r) for r in self._conn().execute(sql, args)]
+
+    def counts(self):
+        return dict(self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+
+    def retry(self, job_id):
+        self._conn().execute(
+            "UPDATE jobs SET status = 'queued', error = NULL, progress = 0, message = '' "
+            "WHERE id = ? AND status = 'failed'",
+            (job_id,),
+        )
+        self._wake.set()
+
+    # ---------- worker side ----------
+
+    def _beat(self):
+        # Keeps this queue's running jobs from looking abandoned
+        while not self._stop.wait(HEARTBEAT_SECONDS):
+            self._conn().execute(
+                "UPDATE jobs SET heartbeat = ? WHERE status = 'running' AND owner = ?",
+                (time.time(), self.owner),
+            )
+
+    def _claim(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Jobs whose owner stopped beating (process died) go back to the queue
+            conn.execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, message = 'requeued after restart' "
+                "WHERE status = 'running' AND COALESCE(heartbeat, 0) < ?",
+                (time.time() - STALE_SECONDS,),
+            )
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY priority DESC, id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = 'running', started = ?, heartbeat = ?, owner = ?, "
+                "attempts = attempts + 1 WHERE id = ?",
+                (now, now, self.owner, row[0]),
+            )
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        return self.get(row[0])
+
+    def _progress(self, job_id):
+        def report(fraction, message=""):
+            self._conn().execute(
+                "UPDATE jobs SET progress = ?, message = ? WHERE id = ?",
+                (max(0.0, min(1.0, fraction)), message, job_id),
+            )
+        return report
+
+    def _work(self):
+        while not self._stop.is_set():
+            job = self._claim()
+            if job is None:
+                self._wake.wait(POLL_INTERVAL)
+                self._wake.clear()
+                continue
+
+            try:
+                result = self.handlers[job["kind"]](job["payload"], self._progress(job["id"]))
+                self._conn().execute(
+                    "UPDATE jobs SET status = 'done', progress = 1, result = ?, finished = ? WHERE id = ?",
+                    (json.dumps(result), time.time(), job["id"]),
+                )
+            except Exception as e:
+                self._conn().execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, message = ?, finished = ? WHERE id = ?",
+                    (traceback.format_exc(), str(e), time.time(), job["id"]),
+                )
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
@@ -1,65 +1,309 @@
+# ============================================================
+# AAA — HEALTH DATA MERGE TOOL
+# STREAMING READERS • K-WAY MERGE • JSON LINES OUT • THROUGHPUT STATS
+# ============================================================
+#
+#   python merge_health_data.py merge --out health_data.jsonl --validate
+#   python merge_health_data.py sync
+#
+# merge: every source is read as a stream (JSON Lines line by line, JSON
+# documents with ijson, which requirements.txt installs; without it a
+# document is parsed whole) by its own reader thread. Each
+# reader cuts its source into timestamp-sorted runs of at most --run-size
+# records; a source that fits in one run stays in memory, longer ones spill
+# their runs to temp files. All runs are then k-way merged by timestamp and
+# written out one JSON line at a time, so memory depends on --run-size and
+# the number of sources, not on how big the sources are.
+#
+# sync: brings the app's timeline index up to date from the same sources.
+# A source whose file (and storage journal) hasn't changed since the last
+# sync isn't read at all.
+#
+# The app's list files are a base document plus a storage.py journal of
+# recent appends. The journal is read and the base opened under the file's
+# storage lock, which is then released: a compaction replaces the base with
+# a new file, so the open handle still holds exactly the records the
+# journal didn't, and the app can keep writing while the base streams.
+#
+# Sources default to the four files the app has always merged; pass
+# --source KIND=PATH (repeatable) to use others.
+
+import argparse
 import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import storage
+from timeline import TimelineIndex, TIMELINE_FILE, merge_streams
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+DEFAULT_SOURCES = [
+    ("log", "health_log.json"),
+    ("photo", "photo_data.json"),
+    ("audio", "vault_files/audio/audio_data.json"),
+    ("summary", "vault_files/reports/summary_data.json"),
+]
+
+# List inside a JSON document that holds the records, per kind
+LIST_KEYS = {"log": "entries", "photo": "photos", "audio": "audio", "summary": "summaries"}
+
+RUN_SIZE = 50_000
+
+
+# ============================================================
+# READING
+# ============================================================
+
+def _first_char(f):
+    while True:
+        c = f.read(1)
+        if not c or not c.isspace():
+            f.seek(0)
+            return c
+
+
+def iter_records(path, kind):
+    # Streams the records of one source file
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        return
+
+    # Held only long enough to pair the base with its journal (see above)
+    with storage.file_lock(path):
+        journal = storage.read_journal(path)
+        f = open(path, "rb") if os.path.exists(path) else None
+
+    if f is None:
+        # A list file that has never been compacted is all journal
+        yield from journal
+        return
+
+    with f:
+        top_level_list = _first_char(f) == b"["
+        if ijson is None:
+            # Without ijson the document has to be parsed whole
+            data = json.load(f)
+            yield from data if top_level_list else data.get(LIST_KEYS.get(kind, kind), [])
+        else:
+            prefix = "item" if top_level_list else f"{LIST_KEYS.get(kind, kind)}.item"
+            # use_float keeps numbers JSON-serialisable (no Decimal)
+            yield from ijson.items(f, prefix, use_float=True)
+
+    if top_level_list:
+        yield from journal
+
+
+def export_row(kind, r):
+    # Same shape health_data.json has always had
+    if kind in ("photo", "audio"):
+        return {"type": kind, "filename": r.get("file", r.get("filename", "")),
+                "stored_as": r.get("file", r.get("stored_as", "")),
+                "timestamp": r.get("timestamp", "")}
+    return {"type": kind, "text": r.get("text", r.get("notes", "")),
+            "timestamp": r.get("timestamp", "")}
+
+
+def validate(kind, r):
+    # Returns a problem description, or None for a valid record
+    if not isinstance(r, dict):
+        return "not an object"
+    ts = r.get("timestamp")
+    if not isinstance(ts, str) or len(ts) < 10 or ts[4] != "-" or ts[7] != "-":
+        return f"bad timestamp {ts!r}"
+    if kind in ("photo", "audio"):
+        if not (r.get("file") or r.get("filename")):
+            return "missing file"
+    elif not isinstance(r.get("text", r.get("notes")), str):
+        return "missing text"
+    return None
+
+
+class SourceStats:
+    def __init__(self, kind, path):
+        self.kind = kind
+        self.path = path
+        self.bytes = sum(os.path.getsize(p) for p in (path, storage.journal_path(path))
+                         if os.path.exists(p))
+        self.records = 0
+        self.invalid = 0
+        self.errors = []     # first few validation problems
+        self.runs = 0
+
+
+def _spill(run, tmp_dir):
+    fd, path = tempfile.mkstemp(suffix=".jsonl", dir=tmp_dir)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        for r in run:
+            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+    return path
+
+
+def _read_run_file(path, kind):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            yield kind, json.loads(line)
+
+
+def read_source(kind, path, tmp_dir, run_size=RUN_SIZE, check=False):
+    # Reads one source into sorted runs → (stats, [iterator of (kind, record)])
+    stats = SourceStats(kind, path)
+    runs, run = [], []
+
+    def close_run():
+        run.sort(key=lambda r: r.get("timestamp", ""))
+        stats.runs += 1
+        runs.append(_spill(run, tmp_dir))
+        run.clear()
+
+    for r in iter_records(path, kind):
+        if check:
+            problem = validate(kind, r)
+            if problem:
+                stats.invalid += 1
+                if len(stats.errors) < 5:
+                    stats.errors.append(f"record {stats.records + stats.invalid}: {problem}")
+                continue
+        stats.records += 1
+        run.append(r)
+        if len(run) >= run_size:
+            close_run()
+
+    if not runs:
+        # Small source: its single run never leaves memory
+        run.sort(key=lambda r: r.get("timestamp", ""))
+        stats.runs = 1
+        return stats, [((kind, r) for r in run)]
+
+    if run:
+        close_run()
+    return stats, [_read_run_file(p, kind) for p in runs]
+
+
+# ============================================================
+# COMMANDS
+# ============================================================
+
+def merge(sources, out, run_size=RUN_SIZE, check=False, log=sys.stderr):
+    start = time.perf_counter()
+    written = 0
+
+    with tempfile.TemporaryDirectory(prefix="aaa_merge_") as tmp_dir:
+        with ThreadPoolExecutor(max_workers=max(1, len(sources)), thread_name_prefix="merge") as pool:
+            read = list(pool.map(lambda s: read_source(s[0], s[1], tmp_dir, run_size, check), sources))
+
+        streams = [stream for _, runs in read for stream in runs]
+        f = sys.stdout if out == "-" else open(out, "w", encoding="utf-8")
+        try:
+            for kind, r in merge_streams(*streams):
+                f.write(json.dumps(export_row(kind, r), ensure_ascii=False) + "\n")
+                written += 1
+        finally:
+            if f is not sys.stdout:
+                f.close()
+
+    elapsed = time.perf_counter() - start
+    total_bytes = sum(s.bytes for s, _ in read)
+
+    for s, _ in read:
+        note = f", {s.invalid} invalid" if check else ""
+        print(f"  {s.kind:<8} {s.path}: {s.records:,} records in {s.runs} run(s), "
+              f"{s.bytes / 1e6:.1f} MB{note}", file=log)
+        for e in s.errors:
+            print(f"      ✖ {e}", file=log)
+    print(f"\n✔ {written:,} records merged into {out} in {elapsed:.2f}s — "
+          f"{written / elapsed if elapsed else 0:,.0f} records/s, "
+          f"{total_bytes / 1e6 / elapsed if elapsed else 0:.1f} MB/s\n", file=log)
+    return written
+
+
+def file_signature(path):
+    # Base file and storage journal: an append only changes the journal
+    parts = []
+    for p in (path, storage.journal_path(path)):
+        try:
+            s = os.stat(p)
+            parts.append(f"{s.st_ino}:{s.st_mtime_ns}:{s.st_size}")
+        except OSError:
+            parts.append("-")
+    return "/".join(parts)
+
+
+def sync(sources, db_path=TIMELINE_FILE, check=False, log=sys.stdout):
+    # Only sources whose file changed since the last run are re-read, and
+    # only their new or removed records touch the timeline
+    timeline = TimelineIndex(db_path)
+    for kind, path in sources:
+        sig = file_signature(path)
+        if timeline.signature(path) == sig:
+            print(f"• {path} unchanged", file=log)
+            continue
+
+        records = iter_records(path, kind)
+        if check:
+            records = (r for r in records if validate(kind, r) is None)
+        added, removed = timeline.sync_source(path, kind, records, sig)
+        print(f"✔ {path}: +{added} / -{removed}", file=log)
+
+
+def parse_sources(values):
+    sources = []
+    for v in values or []:
+        kind, sep, path = v.partition("=")
+        if not sep or not path:
+            raise argparse.ArgumentTypeError(f"--source expects KIND=PATH, got {v!r}")
+        sources.append((kind, path))
+    return sources
+
+
+def existing(sources, log):
+    found = []
+    for kind, path in sources:
+        if os.path.exists(path) or os.path.exists(storage.journal_path(path)):
+            found.append((kind, path))
+        else:
+            print(f"• {path} not found — skipped", file=log)
+    return found
+
+
+if __name__ == "__main__":
+    # Options every command takes, accepted after the command name
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--source", action="append", metavar="KIND=PATH",
+                        help="source file (repeatable); defaults to the standard four")
+    common.add_argument("--validate", action="store_true",
+                        help="skip and report records without a valid timestamp / content")
+
+    parser = argparse.ArgumentParser(description="Merge AAA health data sources by timestamp")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    m = sub.add_parser("merge", parents=[common],
+                       help="Stream all sources into one timestamp-ordered JSON Lines file")
+    m.add_argument("--out", default="health_data.jsonl", help="output file, or - for stdout")
+    m.add_argument("--run-size", type=int, default=RUN_SIZE,
+                   help="records held in memory per source before spilling a sorted run")
+
+    s = sub.add_parser("sync", parents=[common], help="Incrementally update the app's timeline index")
+    s.add_argument("--db", default=TIMELINE_FILE)
+
+    args = parser.parse_args()
+    log = sys.stderr if args.command == "merge" and args.out == "-" else sys.stdout
+    sources = existing(parse_sources(args.source) or DEFAULT_SOURCES, log)
+
+    if ijson is None:
+        print("• ijson not installed — JSON documents are parsed whole "
+              "(pip install ijson, or use .jsonl sources)", file=log)
 
-# Correct paths
-audio_file = "vault_files/audio/audio_data.json"
-photo_file = "photo_data.json"
-health_log_file = "health_log.json"
-summary_file = "vault_files/reports/summary_data.json"
-
-# Load JSON files
-with open(health_log_file) as f:
-    log = json.load(f)
-
-with open(photo_file) as f:
-    photos = json.load(f)
-
-with open(audio_file) as f:
-    audio = json.load(f)
-
-with open(summary_file) as f:
-    summaries = json.load(f)
-
-# Build combined list
-combined = []
-
-# Health log entries
-for l in log.get("entries", []):
-    combined.append({
-        "type": "log",
-        "text": l.get("text", ""),
-        "timestamp": l.get("timestamp", "")
-    })
-
-# Photos
-for p in photos.get("photos", []):
-    combined.append({
-        "type": "photo",
-        "filename": p.get("file", ""),
-        "stored_as": p.get("file", ""),
-        "timestamp": p.get("timestamp", "")
-    })
-
-# Audio notes
-for a in audio.get("audio", []):
-    combined.append({
-        "type": "audio",
-        "filename": a.get("file", ""),
-        "stored_as": a.get("file", ""),
-        "timestamp": a.get("timestamp", "")
-    })
-
-# Summaries
-for s in summaries.get("summaries", []):
-    combined.append({
-        "type": "summary",
-        "text": s.get("text", ""),
-        "timestamp": s.get("timestamp", "")
-    })
-
-# Save final merged file
-final = {"data": combined}
-
-with open("health_data.json", "w") as f:
-    json.dump(final, f, indent=4)
-
-print("\n✔ Merged health_data.json created successfully!\n")
+    if args.command == "merge":
+        merge(sources, args.out, args.run_size, args.validate, log)
+    else:
+        sync(sources, args.db, args.validate, log)
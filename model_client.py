@@ -0,0 +1,444 @@
+# ============================================================
+# AAA — MODEL CLIENT
+# SHARED CLIENTS • RPM/TPM TOKEN BUCKETS • RETRIES • CIRCUIT BREAKER
+# ============================================================
+#
+# Every model call in the app goes through get_client(name). Clients are
+# created once per model name and shared by all pages, sessions and worker
+# threads, so the underlying model object (and its HTTP connection) is
+# reused and the rate limits are enforced for the whole process.
+#
+# A ModelClient has the same generate_content(contents, stream=False)
+# signature as genai.GenerativeModel, so the OCR pipeline, streaming and
+# insights code take either one unchanged.
+#
+# Before a request goes out it takes one request from the requests/min
+# bucket and its estimated prompt size from the tokens/min bucket, waiting
+# if either is empty. Transient errors (quota, overload, timeouts) are
+# retried with jittered exponential backoff. Every call that fails, for
+# whatever reason, counts against the circuit breaker: once
+# BREAKER_THRESHOLD calls in a row have failed, it opens and calls fail
+# fast with ModelUnavailable for BREAKER_COOLDOWN seconds, after which a
+# single trial call decides whether it closes again.
+#
+# Streaming responses fail while being iterated, not when the request is
+# sent, so they are wrapped: an error mid-stream counts against the
+# breaker too, and a transient one before the first chunk re-sends the
+# request. Once chunks have been handed out a retry would repeat text, so
+# the error is raised instead.
+#
+# The default request rate leaves room for the OCR pipeline's
+# OCR_CONCURRENCY workers (a page call takes a couple of seconds); set
+# AAA_MODEL_RPM to the API key's real quota, e.g. 15 on the free tier.
+#
+# AAA_MODEL_BACKEND=stub swaps Gemini for a deterministic local model
+# (StubModel), so the app, the benchmarks and the tests run offline with no
+# API key. It is the only model stand-in in the app.
+
+import hashlib
+import os
+import random
+import threading
+import time
+
+import perf
+from ocr_pipeline import OCR_CONCURRENCY
+
+MODEL_BACKEND = os.environ.get("AAA_MODEL_BACKEND", "gemini")
+MODEL_RPM = int(os.environ.get("AAA_MODEL_RPM", str(max(60, 30 * OCR_CONCURRENCY))))
+MODEL_TPM = int(os.environ.get("AAA_MODEL_TPM", "1000000"))
+MODEL_TIMEOUT = float(os.environ.get("AAA_MODEL_TIMEOUT", "120"))
+MODEL_RETRIES = 3
+MODEL_BACKOFF = 1.0        # seconds; doubled on each retry, plus jitter
+BREAKER_THRESHOLD = 5      # consecutive failed calls before opening
+BREAKER_COOLDOWN = 30.0    # seconds the breaker stays open
+STUB_LATENCY = float(os.environ.get("AAA_STUB_LATENCY", "0"))
+
+IMAGE_TOKENS = 258         # Gemini's fixed token cost per image part
+
+# Exception class names (google.api_core / requests / builtins) worth retrying
+TRANSIENT_ERRORS = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "Aborted", "TimeoutError", "ConnectionError",
+    "ReadTimeout", "ConnectTimeout",
+}
+TRANSIENT_CODES = {429, 500, 502, 503, 504}
+
+
+class ModelUnavailable(RuntimeError):
+    # Raised when a call still fails after retries, or the breaker is open
+    pass
+
+
+def is_transient(exc):
+    if type(exc).__name__ in TRANSIENT_ERRORS:
+        return True
+    code = getattr(exc, "code", None)
+    return isinstance(code, int) and code in TRANSIENT_CODES
+
+
+def estimate_prompt_tokens(contents):
+    # ~4 characters per token for text; images cost a flat IMAGE_TOKENS
+    parts = contents if isinstance(contents, list) else [contents]
+    tokens = 0
+    for part in parts:
+        if isinstance(part, (bytes, bytearray)) or isinstance(part, dict):
+            tokens += IMAGE_TOKENS
+        else:
+            tokens += len(str(part)) // 4 + 1
+    return tokens
+
+
+def payload_bytes(contents):
+    # Request size: raw bytes of image parts + UTF-8 length of text parts
+    parts = contents if isinstance(contents, list) else [contents]
+    total = 0
+    for part in parts:
+        if isinstance(part, dict):
+            part = part.get("data", b"")
+        total += len(part) if isinstance(part, (bytes, bytearray)) else len(str(part).encode("utf-8"))
+    return total
+
+
+# ============================================================
+# RATE LIMITING
+# ============================================================
+
+class TokenBucket:
+    # Refills continuously at rate_per_min; holds at most one minute's worth
+    def __init__(self, rate_per_min):
+        self.capacity = float(max(1, rate_per_min))
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, n=1):
+        # Blocks until n tokens are available; returns seconds waited.
+        # Requests larger than the bucket only wait for a full bucket.
+        n = min(float(n), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.level >= n:
+                    self.level -= n
+                    return waited
+                delay = (n - self.level) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def charge(self, n):
+        # Takes tokens without waiting (may go negative), e.g. when the
+        # real usage turned out higher than the estimate
+        with self._lock:
+            self._refill(time.monotonic())
+            self.level -= n
+
+
+class RateLimiter:
+    def __init__(self, rpm=MODEL_RPM, tpm=MODEL_TPM):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    def acquire(self, tokens):
+        return self.requests.acquire(1) + self.tokens.acquire(tokens)
+
+
+# ============================================================
+# CIRCUIT BREAKER
+# ============================================================
+
+class CircuitBreaker:
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return
+            if state == "half-open" and not self._trial:
+                self._trial = True
+                return
+            wait = max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+            raise ModelUnavailable(
+                f"Model temporarily unavailable after {self.failures} failed calls; "
+                f"retrying in {wait:.0f}s"
+            )
+
+    def record(self, ok):
+        with self._lock:
+            self._trial = False
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.failures >= self.threshold:
+                    self.opened_at = time.monotonic()
+
+
+# ============================================================
+# CLIENT
+# ============================================================
+
+class ModelClient:
+    def __init__(self, model_name, backend, limiter=None, breaker=None,
+                 retries=MODEL_RETRIES, backoff=MODEL_BACKOFF, timeout=MODEL_TIMEOUT):
+        self.model_name = model_name
+        self.backend = backend
+        self.limiter = limiter or RateLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.calls = 0
+        self.retried = 0
+        self.failed = 0
+        self.throttled_s = 0.0
+        self._lock = threading.Lock()
+
+    def _count(self, field, n=1):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + n)
+
+    def _send(self, contents, stream, kwargs):
+        if self.timeout and not isinstance(self.backend, StubModel):
+            kwargs.setdefault("request_options", {"timeout": self.timeout})
+        if stream:
+            # Timed by stream_generate(), which consumes the chunks
+            return self.backend.generate_content(contents, stream=True, **kwargs)
+        with perf.span("model.generate_content", model=self.model_name) as s:
+            s.bytes = payload_bytes(contents)
+            return self.backend.generate_content(contents, stream=False, **kwargs)
+
+    def _backoff(self, attempt):
+        time.sleep(self.backoff * (2 ** attempt) * (1 + random.random()))
+
+    def _failed(self, e, attempts):
+        # Counts a call that won't be retried; returns the error to raise
+        self._count("failed")
+        if not is_transient(e):
+            return e
+        return ModelUnavailable(f"{self.model_name} failed after {attempts} attempts: {e}")
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        response = self._request(contents, stream, kwargs)
+        return _Stream(self, response, contents, kwargs) if stream else response
+
+    def _request(self, contents, stream, kwargs):
+        estimate = estimate_prompt_tokens(contents)
+
+        for attempt in range(self.retries + 1):
+            self.breaker.before_call()
+            self._count("throttled_s", self.limiter.acquire(estimate))
+            self._count("calls")
+            try:
+                response = self._send(contents, stream, kwargs)
+            except Exception as e:
+                self.breaker.record(False)
+                if not is_transient(e) or attempt == self.retries:
+                    err = self._failed(e, attempt + 1)
+                    if err is e:
+                        raise
+                    raise err from e
+                self._count("retried")
+                self._backoff(attempt)
+                continue
+
+            self.breaker.record(True)
+            if not stream:
+                usage = getattr(response, "usage_metadata", None)
+                actual = getattr(usage, "prompt_token_count", None)
+                if actual and actual > estimate:
+                    self.limiter.tokens.charge(actual - estimate)
+            return response
+
+    def stats(self):
+        return {"model": self.model_name, "backend": type(self.backend).__name__,
+                "calls": self.calls, "retried": self.retried, "failed": self.failed,
+                "throttled_s": self.throttled_s, "breaker": self.breaker.state}
+
+
+class _Stream:
+    # A streaming response whose iteration errors go through the client's
+    # breaker and retry policy; other attributes (usage_metadata, ...) are
+    # those of the current underlying response
+    def __init__(self, client, response, contents, kwargs):
+        self._client = client
+        self._response = response
+        self._contents = contents
+        self._kwargs = kwargs
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __iter__(self):
+        client = self._client
+        for attempt in range(client.retries + 1):
+            started = False
+            try:
+                for chunk in self._response:
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                client.breaker.record(False)
+                if started or not is_transient(e) or attempt == client.retries:
+                    err = client._failed(e, attempt + 1)
+                    if err is e:
+                        raise
+                    raise err from e
+                client._count("retried")
+                client._backoff(attempt)
+                self._response = client._request(self._contents, True, self._kwargs)
+
+
+# ============================================================
+# OFFLINE STUB BACKEND
+# ============================================================
+
+class StubUsage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+
+
+class StubChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubStream:
+    # Yields the pieces after first_delay (time to first token), then one
+    # every `delay` seconds
+    def __init__(self, pieces, first_delay, delay):
+        self._pieces = pieces
+        self._first_delay = first_delay
+        self._delay = delay
+        self.usage_metadata = None
+
+    def __iter__(self):
+        for i, piece in enumerate(self._pieces):
+            time.sleep(self._first_delay if i == 0 else self._delay)
+            yield StubChunk(piece)
+
+    @property
+    def text(self):
+        return "".join(self._pieces)
+
+
+class StubModel:
+    # Deterministic stand-in for Gemini: the reply depends only on the
+    # model name and the input, so caches and benchmarks behave as they
+    # would against the real model. Image parts get a fake OCR text.
+    # `latency` is the time to the reply (or to the first streamed chunk),
+    # `chunk_delay` the gap between streamed chunks; the first `fail_first`
+    # calls raise, to exercise retries and failure handling.
+    def __init__(self, model_name, latency=STUB_LATENCY, words_per_chunk=3, chunk_delay=0.0,
+                 fail_first=0):
+        self.model_name = model_name
+        self.latency = latency
+        self.words_per_chunk = words_per_chunk
+        self.chunk_delay = chunk_delay
+        self.fail_first = fail_first
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _reply(self, contents):
+        parts = contents if isinstance(contents, list) else [contents]
+        h = hashlib.sha256(self.model_name.encode("utf-8"))
+        images = []
+        for part in parts:
+            data = part if isinstance(part, (bytes, bytearray)) else str(part).encode("utf-8")
+            h.update(data)
+            if isinstance(part, (bytes, bytearray)):
+                images.append(len(part))
+        digest = h.hexdigest()[:12]
+
+        if images:
+            return f"[stub OCR {digest}: {sum(images)} bytes of image data]"
+        return (f"**Offline result** ({digest}) for {len(str(contents))} characters of input.\n\n"
+                "- Key symptoms: none detected by the stub model\n"
+                "- Risk markers: n/a\n- Trends: n/a\n")
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if call <= self.fail_first:
+            if self.latency:
+                time.sleep(self.latency)
+            raise RuntimeError(f"stub model: failure on call {call}")
+
+        text = self._reply(contents)
+        words = text.split(" ")
+        n = self.words_per_chunk
+        pieces = [" ".join(words[i:i + n]) + (" " if i + n < len(words) else "")
+                  for i in range(0, len(words), n)]
+
+        response = StubStream(pieces, self.latency, self.chunk_delay) if stream else StubChunk(text)
+        response.usage_metadata = StubUsage(estimate_prompt_tokens(contents), len(text) // 4 + 1)
+        if not stream and self.latency:
+            time.sleep(self.latency)
+        return response
+
+
+# ============================================================
+# REGISTRY
+# ============================================================
+
+_clients = {}
+_clients_lock = threading.Lock()
+_configured = {}
+
+
+def configure(api_key):
+    # Called once by the app before the first Gemini client is created
+    _configured["api_key"] = api_key
+
+
+def _backend(model_name, backend):
+    if backend == "stub":
+        return StubModel(model_name)
+    if backend != "gemini":
+        raise ValueError(f"Unknown model backend {backend!r} (expected 'gemini' or 'stub')")
+
+    from google import generativeai as genai
+    if "api_key" in _configured:
+        genai.configure(api_key=_configured.pop("api_key"))
+    return genai.GenerativeModel(model_name)
+
+
+def get_client(model_name, backend=None):
+    backend = backend or MODEL_BACKEND
+    with _clients_lock:
+        client = _clients.get((model_name, backend))
+        if client is None:
+            client = ModelClient(model_name, _backend(model_name, backend))
+            _clients[(model_name, backend)] = client
+        return client
+
+
+def client_stats():
+    with _clients_lock:
+        return [c.stats() for c in _clients.values()]
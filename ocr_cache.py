@@ -0,0 +1,111 @@
+# ============================================================
+# AAA — CONTENT-ADDRESSED OCR CACHE
+# KEY = SHA-256(IMAGE) + MODEL + PROMPT • SIZE-BOUNDED LRU
+# ============================================================
+#
+# Re-uploading a file (or OCR-ing something already in the vault) renders
+# byte-identical page images, so their OCR text can be served from disk
+# instead of calling the model again.
+
+import hashlib
+import os
+import threading
+import time
+
+import sqlite_util
+
+CACHE_FILE = "ocr_cache.db"
+CACHE_MAX_BYTES = int(os.environ.get("AAA_OCR_CACHE_MB", "256")) * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key       TEXT PRIMARY KEY,
+    text      TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    hits      INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);
+
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def cache_key(image_bytes, model_name, prompt):
+    h = hashlib.sha256(image_bytes).hexdigest()
+    return hashlib.sha256(f"{h}\0{model_name}\0{prompt}".encode()).hexdigest()
+
+
+class OcrCache:
+    def __init__(self, db_path=CACHE_FILE, max_bytes=CACHE_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self._conn = sqlite_util.LocalConnection(self.db_path)
+        self._write_lock = threading.Lock()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _bump(self, conn, name, n=1):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, n),
+        )
+
+    def get(self, key):
+        with self._conn() as conn:
+            row = conn.execute("SELECT text FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._bump(conn, "misses")
+                return None
+            conn.execute(
+                "UPDATE entries SET last_used = ?, hits = hits + 1 WHERE key = ?",
+                (time.time(), key),
+            )
+            self._bump(conn, "hits")
+            return row[0]
+
+    def put(self, key, text):
+        size = len(text.encode("utf-8"))
+        with self._write_lock, self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, text, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()),
+            )
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            if total <= self.max_bytes:
+                break
+            victims.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        self._bump(conn, "evictions", len(victims))
+
+    def clear(self):
+        with self._write_lock, self._conn() as conn:
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM counters")
+
+    def stats(self):
+        conn = self._conn()
+        counters = dict(conn.execute("SELECT name, value FROM counters"))
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "entries": entries,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": hits,
+            "misses": misses,
+            "evictions": counters.get("evictions", 0),
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+        }
@@ -0,0 +1,142 @@
+# ============================================================
+# AAA — CONCURRENT OCR PIPELINE
+# RENDER STAGE → BOUNDED WORKER POOL → ORDERED RESULTS
+# ============================================================
+#
+# The caller's thread renders pages one at a time (stage 1) while a thread
+# pool sends already-rendered pages to the model (stage 2). At most
+# 2 × concurrency rendered pages are held in memory at once. Progress
+# callbacks always run on the caller's thread, so they can update
+# Streamlit widgets directly.
+#
+# With an OcrCache, pages whose image was OCR'd before (same bytes, model
+# and prompt) are answered from the cache and never reach the pool.
+
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ocr_cache import cache_key
+
+OCR_MODEL = "gemini-2.0-flash"
+OCR_PROMPT = "Extract ALL text (no summary)."
+OCR_CONCURRENCY = int(os.environ.get("AAA_OCR_CONCURRENCY", "4"))
+OCR_RETRIES = 3
+OCR_BACKOFF = 1.0   # seconds; doubled on each retry, plus jitter
+
+
+# ============================================================
+# PIPELINE
+# ============================================================
+
+class OcrFailed(RuntimeError):
+    # Some pages still failed after retries. The pages that succeeded are
+    # cached, so running the document again only re-sends the failed ones.
+    def __init__(self, failed, results):
+        self.failed = failed        # {page_no: error}
+        self.results = results      # [(page_no, text)] of the pages that worked
+        pages = ", ".join(str(n) for n in sorted(failed))
+        first = failed[min(failed)]
+        super().__init__(f"OCR failed on page(s) {pages}: {first}")
+
+
+def ocr_with_retry(model, image_bytes, prompt=OCR_PROMPT, retries=OCR_RETRIES, backoff=OCR_BACKOFF):
+    for attempt in range(retries + 1):
+        try:
+            return model.generate_content([prompt, image_bytes]).text
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random()))
+
+
+def cached_ocr(model, image_bytes, cache=None, model_name=OCR_MODEL, prompt=OCR_PROMPT,
+               retries=OCR_RETRIES, backoff=OCR_BACKOFF):
+    # Single-image OCR through the cache; returns (text, from_cache)
+    key = cache_key(image_bytes, model_name, prompt) if cache else None
+    if key:
+        text = cache.get(key)
+        if text is not None:
+            return text, True
+    text = ocr_with_retry(model, image_bytes, prompt, retries, backoff)
+    if key:
+        cache.put(key, text)
+    return text, False
+
+
+def run_ocr(pages, model, total=None, concurrency=OCR_CONCURRENCY, prompt=OCR_PROMPT,
+            retries=OCR_RETRIES, backoff=OCR_BACKOFF, on_progress=None,
+            cache=None, model_name=OCR_MODEL):
+    # pages: iterable of (page_no, image_bytes), rendered lazily.
+    # on_progress(page_no, status, done, total) with status in
+    # "queued" / "cached" / "done" / "failed". Returns [(page_no, text)] in
+    # page order. If any page still fails after retries, the other pages
+    # are finished (and cached) and then OcrFailed is raised.
+    concurrency = max(1, concurrency)
+    results = {}
+    failed = {}
+    finished = queue.Queue()
+    slots = threading.BoundedSemaphore(concurrency * 2)
+
+    def notify(page_no, status):
+        if on_progress:
+            on_progress(page_no, status, len(results), total)
+
+    def work(page_no, image_bytes, key):
+        try:
+            text = ocr_with_retry(model, image_bytes, prompt, retries, backoff)
+            if key:
+                cache.put(key, text)
+            finished.put((page_no, text, None))
+        except Exception as e:
+            finished.put((page_no, None, e))
+        finally:
+            slots.release()
+
+    def drain(block):
+        while True:
+            try:
+                page_no, text, err = finished.get(block=block)
+            except queue.Empty:
+                return
+            if err is None:
+                results[page_no] = text
+            else:
+                failed[page_no] = err
+            notify(page_no, "done" if err is None else "failed")
+            block = False
+
+    submitted = cached = 0
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ocr") as pool:
+        for page_no, image_bytes in pages:
+            key = cache_key(image_bytes, model_name, prompt) if cache else None
+            if key:
+                text = cache.get(key)
+                if text is not None:
+                    results[page_no] = text
+                    cached += 1
+                    notify(page_no, "cached")
+                    drain(False)
+                    continue
+
+            while not slots.acquire(timeout=0.05):
+                drain(False)
+            pool.submit(work, page_no, image_bytes, key)
+            submitted += 1
+            notify(page_no, "queued")
+            drain(False)
+
+        while len(results) + len(failed) < submitted + cached:
+            drain(True)
+
+    if failed:
+        raise OcrFailed(failed, sorted(results.items()))
+    return sorted(results.items())
+
+
+def join_pages(results):
+    # Same layout page_ocr has always stored for PDFs
+    return "".join(f"\n\n--- PAGE {n} ---\n{text}" for n, text in results)
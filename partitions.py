@@ -0,0 +1,116 @@
+# ============================================================
+# AAA — PER-USER DATA PARTITIONS
+# SHARDED DIRECTORIES • ONE LOCK PER PARTITION • PER-PARTITION RESOURCES
+# ============================================================
+#
+# Every user (patient profile) owns a partition: their own health log, OCR
+# results, vault, photos, snapshots, indexes and caches (OCR cache, stored
+# AI results, rendered PDF pages), under
+#
+#   data/<shard>/<user>/        shard = first 2 hex chars of sha256(user)
+#
+# so no directory grows past a few hundred entries and two users never
+# write the same file. Pages only ever touch the current user's partition.
+# The "default" partition is the original single-user layout in the app
+# directory, so existing installs keep their data where it is.
+#
+# Partition.lock serialises multi-file updates (snapshot restore) within a
+# partition; writes to different partitions never wait on each other.
+# Objects built on a partition's files (vaults, indexes, SQLite engine) are
+# created once per partition via resource() and shared by all sessions and
+# worker threads.
+#
+# Partitions separate data, they are not an access boundary: the app has
+# no login, so any session can open any profile. Put authentication in
+# front of the app before giving profiles to different people.
+
+import hashlib
+import os
+import re
+import threading
+
+DATA_ROOT = os.environ.get("AAA_DATA_ROOT", "data")
+DEFAULT_PARTITION = "default"
+
+_SLUG = re.compile(r"[^a-z0-9._-]+")
+
+
+def partition_id(name):
+    # Filesystem-safe id for a user name / e-mail
+    pid = _SLUG.sub("-", (name or "").strip().lower()).strip("-.")[:64]
+    return pid or DEFAULT_PARTITION
+
+
+def shard(pid):
+    return hashlib.sha256(pid.encode("utf-8")).hexdigest()[:2]
+
+
+class Partition:
+    def __init__(self, pid, root=DATA_ROOT):
+        self.id = pid
+        self.dir = "." if pid == DEFAULT_PARTITION else os.path.join(root, shard(pid), pid)
+
+        self.log_file = self.path("health_log.json")
+        self.ocr_file = self.path("ocr_results.json")
+        self.vault_dir = self.path("vault_files")
+        self.photo_dir = self.path("photos")
+        self.snapshot_dir = self.path("snapshots")
+        self.db_file = self.path("aaa_health.db")
+        self.index_file = self.path("search_index.db")
+        self.timeline_file = self.path("timeline.db")
+        self.ocr_cache_file = self.path("ocr_cache.db")
+        self.results_file = self.path("ai_results.db")
+        self.render_dir = self.path("render_cache")
+
+        for d in (self.vault_dir, self.photo_dir, self.snapshot_dir):
+            os.makedirs(d, exist_ok=True)
+
+        self.lock = threading.RLock()
+        self._resources = {}
+        self._resource_locks = {}
+        self._resources_lock = threading.Lock()
+
+    def path(self, name):
+        return os.path.normpath(os.path.join(self.dir, name))
+
+    def resource(self, name, factory):
+        # One shared instance of factory() per partition and name. Each name
+        # has its own build lock, and the registry lock is never held while a
+        # factory runs, so factories may open other resources of the same
+        # partition.
+        with self._resources_lock:
+            if name in self._resources:
+                return self._resources[name]
+            lock = self._resource_locks.setdefault(name, threading.Lock())
+        with lock:
+            if name not in self._resources:
+                value = factory()
+                with self._resources_lock:
+                    self._resources[name] = value
+            return self._resources[name]
+
+
+_partitions = {}
+_partitions_lock = threading.Lock()
+
+
+def get_partition(name=DEFAULT_PARTITION, root=DATA_ROOT):
+    pid = partition_id(name)
+    with _partitions_lock:
+        part = _partitions.get((root, pid))
+        if part is None:
+            part = Partition(pid, root)
+            _partitions[(root, pid)] = part
+        return part
+
+
+def list_partitions(root=DATA_ROOT):
+    # Ids of all partitions on disk, default first
+    found = set()
+    if os.path.isdir(root):
+        for s in os.listdir(root):
+            shard_dir = os.path.join(root, s)
+            if os.path.isdir(shard_dir):
+                found.update(d for d in os.listdir(shard_dir)
+                             if os.path.isdir(os.path.join(shard_dir, d)))
+    return [DEFAULT_PARTITION] + sorted(found - {DEFAULT_PARTITION})
@@ -0,0 +1,65 @@
+# ============================================================
+# AAA — PDF TEXT-LAYER FAST PATH
+# PER-PAGE QUALITY SCORE • ONLY SCANNED PAGES GO TO THE MODEL
+# ============================================================
+#
+# Lab reports exported from a hospital system already carry their text.
+# Reading it with page.get_text() takes milliseconds and costs nothing, so
+# in hybrid mode every PDF page is scored first and only pages without a
+# usable text layer (scans, photos, garbled encodings) are rendered and
+# sent to the model.
+#
+# A page's score is in [0, 1]: the share of characters that are ordinary
+# text, times the share of tokens that look like words or numbers. Pages
+# with too little text, or whose area is mostly covered by images with
+# only a caption's worth of text on top, score 0.
+
+import os
+import re
+
+OCR_MODE = os.environ.get("AAA_OCR_MODE", "hybrid")    # "hybrid" or "vision"
+TEXT_MIN_SCORE = float(os.environ.get("AAA_TEXT_MIN_SCORE", "0.75"))
+TEXT_MIN_CHARS = 40
+SCANNED_COVERAGE = 0.5     # image share of the page above which short text is ignored
+SCANNED_MAX_CHARS = 200
+
+_WORD = re.compile(r"^[\w.,:;%/()+\-<>=°µ]*[^\W_][\w.,:;%/()+\-<>=°µ]*$")
+
+
+def text_score(text):
+    stripped = text.strip()
+    if len(stripped) < TEXT_MIN_CHARS:
+        return 0.0
+
+    plain = sum(1 for c in stripped if c.isprintable() or c in "\n\t") - stripped.count("�")
+    tokens = stripped.split()
+    wordlike = sum(1 for t in tokens if _WORD.match(t))
+    return max(0.0, plain / len(stripped)) * (wordlike / len(tokens))
+
+
+def image_coverage(page):
+    # Share of the page area covered by images (overlaps counted twice, capped at 1)
+    area = abs(page.rect)
+    if not area:
+        return 0.0
+    covered = sum(abs(page.rect & info["bbox"]) for info in page.get_image_info())
+    return min(1.0, covered / area)
+
+
+def score_page(page):
+    # (text, score) for one PyMuPDF page
+    text = page.get_text("text", sort=True)
+    score = text_score(text)
+    if score and len(text.strip()) < SCANNED_MAX_CHARS and image_coverage(page) > SCANNED_COVERAGE:
+        score = 0.0
+    return text, score
+
+
+def text_layer_pages(doc, min_score=TEXT_MIN_SCORE):
+    # {page_no: text} for the 1-based pages whose text layer can be used as is
+    usable = {}
+    for i, page in enumerate(doc):
+        text, score = score_page(page)
+        if score >= min_score:
+            usable[i + 1] = text.strip()
+    return usable
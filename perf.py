@@ -0,0 +1,224 @@
+# ============================================================
+# AAA — PERFORMANCE INSTRUMENTATION
+# TIMED SPANS • RING BUFFER • PERCENTILES • OPENMETRICS EXPORT
+# ============================================================
+#
+# Hot paths wrap themselves in a span:
+#
+#   with perf.span("storage.read", file="health_log.json") as s:
+#       ...
+#       s.bytes = len(raw)
+#
+# or use the @perf.timed(name) decorator. Each finished span appends one
+# (time, op, labels, seconds, bytes, ok) sample to a ring buffer of the last
+# RING_SIZE samples, shared by every session and worker thread, and adds to
+# per-op running totals. summary() turns the ring into p50/p95/p99 per
+# op + labels; the totals (calls, errors, seconds, bytes) cover the whole
+# process lifetime.
+#
+# export() writes everything as OpenMetrics text to EXPORT_FILE, which a
+# node-exporter textfile collector or any Prometheus-compatible scraper can
+# pick up. The app calls export_if_due() at the end of every run.
+#
+# Instrumented operations are leaves: a span never contains another span
+# of the same kind of work, so per-group sums (file I/O, JSON, PDF, model)
+# don't count anything twice. The one exception is "page", the whole run
+# of a page function, which encloses everything done on the script thread.
+#
+# Recording costs two perf_counter() calls and a deque append under a lock;
+# AAA_PERF=0 turns spans into no-ops.
+
+import functools
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+ENABLED = os.environ.get("AAA_PERF", "1") != "0"
+RING_SIZE = int(os.environ.get("AAA_PERF_RING", "20000"))
+EXPORT_FILE = os.environ.get("AAA_PERF_EXPORT", "aaa_metrics.prom")
+EXPORT_SECONDS = float(os.environ.get("AAA_PERF_EXPORT_SECONDS", "60"))
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_ring = deque(maxlen=RING_SIZE)
+_totals = {}          # (op, labels) → [calls, errors, seconds, bytes]
+_lock = threading.Lock()
+_export_lock = threading.Lock()   # one export at a time; guards _last_export
+_last_export = [0.0]
+
+
+class Span:
+    # Handed out by span(); set .bytes to the amount of data processed
+    __slots__ = ("bytes",)
+
+    def __init__(self):
+        self.bytes = 0
+
+
+def _key(op, labels):
+    return op, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def record(op, seconds, nbytes=0, ok=True, **labels):
+    if not ENABLED:
+        return
+    key = _key(op, labels)
+    with _lock:
+        _ring.append((time.time(), key, seconds, nbytes, ok))
+        t = _totals.get(key)
+        if t is None:
+            t = _totals[key] = [0, 0, 0.0, 0]
+        t[0] += 1
+        t[1] += 0 if ok else 1
+        t[2] += seconds
+        t[3] += nbytes
+
+
+@contextmanager
+def span(op, **labels):
+    s = Span()
+    if not ENABLED:
+        yield s
+        return
+    ok = True
+    start = time.perf_counter()
+    try:
+        yield s
+    except Exception:
+        ok = False
+        raise
+    finally:
+        # BaseException (st.rerun, st.stop) is control flow, not a failure
+        record(op, time.perf_counter() - start, s.bytes, ok, **labels)
+
+
+def timed(op, nbytes=None, **labels):
+    # Decorator; nbytes(result) → bytes processed, if given
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            with span(op, **labels) as s:
+                result = fn(*args, **kwargs)
+                if nbytes is not None:
+                    s.bytes = nbytes(result)
+                return result
+        return inner
+    return wrap
+
+
+# ============================================================
+# READING
+# ============================================================
+
+def _quantile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summary(since=None):
+    # One row per op + labels, slowest total first. Percentiles come from
+    # the ring (only samples newer than `since`, a time.time() value).
+    with _lock:
+        samples = list(_ring)
+        totals = {k: list(v) for k, v in _totals.items()}
+
+    recent = {}
+    for ts, key, seconds, nbytes, ok in samples:
+        if since is None or ts >= since:
+            recent.setdefault(key, []).append(seconds)
+
+    rows = []
+    for key, (calls, errors, seconds, nbytes) in totals.items():
+        op, labels = key
+        window = sorted(recent.get(key, []))
+        row = {"op": op, "labels": dict(labels), "calls": calls, "errors": errors,
+               "total_s": seconds, "bytes": nbytes, "window": len(window)}
+        for q in QUANTILES:
+            row[f"p{int(q * 100)}_ms"] = _quantile(window, q) * 1000 if window else None
+        rows.append(row)
+    rows.sort(key=lambda r: r["total_s"], reverse=True)
+    return rows
+
+
+def reset():
+    with _lock:
+        _ring.clear()
+        _totals.clear()
+
+
+# ============================================================
+# OPENMETRICS EXPORT
+# ============================================================
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(row, **extra):
+    pairs = {"op": row["op"], **row["labels"], **extra}
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs.items()) + "}"
+
+
+def openmetrics(gauges=None):
+    # OpenMetrics text exposition of summary(); gauges: {name: value}
+    rows = summary()
+    lines = [
+        "# TYPE aaa_op_seconds summary",
+        "# UNIT aaa_op_seconds seconds",
+        f"# HELP aaa_op_seconds Duration of instrumented operations (quantiles over the last {RING_SIZE} samples).",
+    ]
+    for r in rows:
+        for q in QUANTILES:
+            value = r[f"p{int(q * 100)}_ms"]
+            if value is not None:
+                lines.append(f"aaa_op_seconds{_labels(r, quantile=q)} {value / 1000:.6f}")
+        lines.append(f"aaa_op_seconds_sum{_labels(r)} {r['total_s']:.6f}")
+        lines.append(f"aaa_op_seconds_count{_labels(r)} {r['calls']}")
+
+    lines += ["# TYPE aaa_op_bytes counter", "# UNIT aaa_op_bytes bytes",
+              "# HELP aaa_op_bytes Bytes processed by instrumented operations."]
+    lines += [f"aaa_op_bytes_total{_labels(r)} {r['bytes']}" for r in rows if r["bytes"]]
+
+    lines += ["# TYPE aaa_op_errors counter",
+              "# HELP aaa_op_errors Instrumented operations that raised."]
+    lines += [f"aaa_op_errors_total{_labels(r)} {r['errors']}" for r in rows]
+
+    for name, value in sorted((gauges or {}).items()):
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+def _write(path, gauges):
+    # Atomic write through a uniquely named temp file, so a scraper never
+    # reads half a file and concurrent writers (other processes) don't
+    # collide on the temp name
+    fd, tmp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                               dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(openmetrics(gauges))
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    _last_export[0] = time.time()
+    return path
+
+
+def export(path=EXPORT_FILE, gauges=None):
+    with _export_lock:
+        return _write(path, gauges)
+
+
+def export_if_due(path=EXPORT_FILE, interval=EXPORT_SECONDS, gauges=None):
+    # gauges: zero-argument callable, only called when an export is due
+    if not ENABLED or interval <= 0:
+        return None
+    with _export_lock:
+        if time.time() - _last_export[0] < interval:
+            return None
+        return _write(path, gauges() if gauges else None)
@@ -0,0 +1,167 @@
+# ============================================================
+# AAA — PDF PAGE RENDER CACHE
+# KEY = (FILE HASH, PAGE, ZOOM) • MEMORY LRU + DISK
+# ============================================================
+#
+# PDF Preview renders only the pages it is about to show. Every rendered
+# PNG is kept in a byte-bounded in-memory LRU and on disk, so scrolling
+# back, switching zoom levels, or reopening the same file later costs a
+# dictionary lookup or one small file read instead of a re-rasterisation.
+#
+# PyMuPDF is imported on the first render, not when the app starts.
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import perf
+
+RENDER_CACHE_DIR = "render_cache"
+MEMORY_MAX_BYTES = 64 * 1024 * 1024
+DISK_MAX_BYTES = 512 * 1024 * 1024
+
+PRUNE_EVERY = 100   # renders between disk-budget checks
+
+THUMB_ZOOM = 0.25
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class RenderCache:
+    def __init__(self, cache_dir=RENDER_CACHE_DIR, memory_max=MEMORY_MAX_BYTES, disk_max=DISK_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.memory_max = memory_max
+        self.disk_max = disk_max
+        self._mem = OrderedDict()
+        self._mem_bytes = 0
+        self._hashes = {}
+        self._lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0, "render": 0}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # ---------- document info ----------
+
+    def _info(self, path):
+        # Hash once per (path, mtime, size) — rehashing a large PDF every rerun
+        # would cost more than rendering a thumbnail
+        s = os.stat(path)
+        sig = (os.path.abspath(path), s.st_mtime_ns, s.st_size)
+        with self._lock:
+            info = self._hashes.get(sig)
+        if info is None:
+            import fitz   # PyMuPDF
+            with fitz.open(path) as doc:
+                info = {"hash": file_hash(path), "pages": len(doc)}
+            with self._lock:
+                self._hashes[sig] = info
+        return info
+
+    def doc_id(self, path):
+        return self._info(path)["hash"]
+
+    def page_count(self, path):
+        return self._info(path)["pages"]
+
+    # ---------- memory tier ----------
+
+    def _mem_get(self, key):
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+            return data
+
+    def _mem_put(self, key, data):
+        with self._lock:
+            if key in self._mem:
+                return
+            self._mem[key] = data
+            self._mem_bytes += len(data)
+            while self._mem_bytes > self.memory_max and len(self._mem) > 1:
+                _, old = self._mem.popitem(last=False)
+                self._mem_bytes -= len(old)
+
+    # ---------- disk tier ----------
+
+    def _disk_path(self, digest, page_no, zoom):
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}_{page_no}_{zoom:g}.png")
+
+    def _disk_put(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def prune_disk(self):
+        # Drop least-recently-used files until the disk tier fits its budget
+        files = []
+        for root, _, names in os.walk(self.cache_dir):
+            for n in names:
+                p = os.path.join(root, n)
+                try:
+                    s = os.stat(p)
+                except OSError:
+                    continue
+                files.append((s.st_mtime, s.st_size, p))
+        total = sum(f[1] for f in files)
+        for _, size, p in sorted(files):
+            if total <= self.disk_max:
+                break
+            try:
+                os.remove(p)
+                total -= size
+            except OSError:
+                pass
+        return total
+
+    # ---------- render ----------
+
+    def render(self, path, page_no, zoom=1.0):
+        # PNG bytes for 1-based page_no at `zoom` (1.0 = 72 dpi)
+        digest = self.doc_id(path)
+        key = (digest, page_no, zoom)
+
+        data = self._mem_get(key)
+        if data is not None:
+            self.hits["memory"] += 1
+            return data
+
+        disk_path = self._disk_path(digest, page_no, zoom)
+        if os.path.exists(disk_path):
+            with open(disk_path, "rb") as f:
+                data = f.read()
+            os.utime(disk_path)   # recency for prune_disk (atime is often disabled)
+            self.hits["disk"] += 1
+        else:
+            import fitz
+            with fitz.open(path) as doc, perf.span("pdf.get_pixmap", use="preview") as s:
+                pix = doc[page_no - 1].get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+                data = pix.tobytes("png")
+                s.bytes = len(data)
+            self._disk_put(disk_path, data)
+            self.hits["render"] += 1
+            if self.hits["render"] % PRUNE_EVERY == 0:
+                self.prune_disk()
+
+        self._mem_put(key, data)
+        return data
+
+    def thumbnail(self, path, page_no):
+        return self.render(path, page_no, THUMB_ZOOM)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_entries": len(self._mem),
+                "memory_bytes": self._mem_bytes,
+                "memory_max": self.memory_max,
+                **self.hits,
+            }
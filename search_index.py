@@ -0,0 +1,120 @@
+# ============================================================
+# AAA — FULL-TEXT SEARCH INDEX
+# SQLITE FTS5 • BM25 RANKING • INCREMENTAL UPDATES
+# ============================================================
+#
+# One FTS row per health-log entry and one per OCR page, kept in its own
+# database so it works with either storage engine. Pages add rows as they
+# save; rebuild() backfills from the full data after an import or restore.
+
+import time
+
+import sqlite_store
+import sqlite_util
+
+INDEX_FILE = "search_index.db"
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS docs USING fts5(
+    kind      UNINDEXED,
+    timestamp UNINDEXED,
+    page      UNINDEXED,
+    title,
+    body,
+    tokenize = 'porter unicode61'
+);
+"""
+
+
+def fts_query(text):
+    # Quote every term so user input can't hit FTS5 syntax errors;
+    # a trailing * on a term keeps prefix search working
+    terms = []
+    for t in text.split():
+        prefix = t.endswith("*") and len(t) > 1
+        t = t.rstrip("*").replace('"', '""')
+        if t:
+            terms.append(f'"{t}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+class SearchIndex:
+    def __init__(self, db_path=INDEX_FILE):
+        self.db_path = db_path
+        self._conn = sqlite_util.LocalConnection(self.db_path)
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    # ---------- writes ----------
+
+    def _rows_for(self, kind, record):
+        if kind == "log":
+            return [("log", record.get("timestamp", ""), None,
+                     record.get("date", ""), record.get("notes", ""))]
+        _, pages = sqlite_store.split_pages(record.get("text", ""))
+        return [("ocr", record.get("timestamp", ""), n, record.get("filename", ""), t)
+                for n, t in pages]
+
+    def add(self, kind, record):
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO docs (kind, timestamp, page, title, body) VALUES (?, ?, ?, ?, ?)",
+                self._rows_for(kind, record),
+            )
+
+    def add_log(self, record):
+        self.add("log", record)
+
+    def add_ocr(self, record):
+        self.add("ocr", record)
+
+    def rebuild(self, logs, ocr):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM docs")
+            for r in logs:
+                conn.executemany(
+                    "INSERT INTO docs (kind, timestamp, page, title, body) VALUES (?, ?, ?, ?, ?)",
+                    self._rows_for("log", r),
+                )
+            for r in ocr:
+                conn.executemany(
+                    "INSERT INTO docs (kind, timestamp, page, title, body) VALUES (?, ?, ?, ?, ?)",
+                    self._rows_for("ocr", r),
+                )
+            conn.execute("INSERT INTO docs(docs) VALUES ('optimize')")
+
+    # ---------- reads ----------
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def search(self, text, limit=50, kind=None):
+        # Returns (hits, elapsed_ms); hits are ranked best-first
+        match = fts_query(text)
+        if not match:
+            return [], 0.0
+
+        sql = """
+            SELECT kind, timestamp, page, title,
+                   snippet(docs, 4, '**', '**', ' … ', 16),
+                   bm25(docs, 0.0, 0.0, 0.0, 5.0, 1.0)
+            FROM docs
+            WHERE docs MATCH ?
+        """
+        args = [match]
+        if kind:
+            sql += " AND kind = ?"
+            args.append(kind)
+        sql += " ORDER BY bm25(docs, 0.0, 0.0, 0.0, 5.0, 1.0) LIMIT ?"
+        args.append(limit)
+
+        start = time.perf_counter()
+        rows = self._conn().execute(sql, args).fetchall()
+        elapsed = (time.perf_counter() - start) * 1000
+
+        hits = [
+            {"kind": k, "timestamp": ts, "page": p, "title": title,
+             "snippet": snip, "score": -score}
+            for k, ts, p, title, snip, score in rows
+        ]
+        return hits, elapsed
@@ -0,0 +1,219 @@
+# ============================================================
+# AAA — DEDUPLICATED SNAPSHOTS
+# MANIFESTS → SHARED, COMPRESSED RECORD BLOCKS
+# ============================================================
+#
+# Layout under SNAPSHOT_DIR:
+#
+#   manifests/<name>     small JSON: timestamp, record counts, block list
+#   blocks/ab/<sha256>.json.gz   BLOCK_RECORDS records per block, shared by
+#                                every snapshot that contains them
+#
+# Health logs and OCR results are append-mostly, so consecutive snapshots
+# share every block except the last few. Each block is remembered by its
+# content hash: a block whose hash matches the previous snapshot's is
+# reused without touching the disk, and a new block is only compressed and
+# written if no snapshot has stored it yet — so writes cost O(changes), not
+# O(history). When the records are the very objects seen last time (the
+# JSON engine's cached lists) even the serialise-and-hash step is skipped;
+# the SQLite engine returns fresh dicts, so its blocks are re-hashed.
+#
+# Old full-copy snapshot_*.json files are converted on first use.
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BLOCK_RECORDS = 256
+DATASETS = ("health_log", "ocr")
+
+CODECS = {
+    "none": ".json",
+    "gzip": ".json.gz",
+    "zstd": ".json.zst",
+}
+
+
+def _compress(codec, raw):
+    if codec == "gzip":
+        return gzip.compress(raw, compresslevel=6)
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=6).compress(raw)
+    return raw
+
+
+def _decompress(ref, data):
+    if ref.endswith(".gz"):
+        return gzip.decompress(data)
+    if ref.endswith(".zst"):
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+class SnapshotStore:
+    def __init__(self, root, codec=None):
+        codec = codec or os.environ.get("AAA_SNAPSHOT_COMPRESSION", "gzip")
+        if codec == "zstd" and zstandard is None:
+            codec = "gzip"
+        self.codec = codec
+        self.root = root
+        self.manifest_dir = os.path.join(root, "manifests")
+        self.block_dir = os.path.join(root, "blocks")
+        self._memo = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.manifest_dir, exist_ok=True)
+        os.makedirs(self.block_dir, exist_ok=True)
+        self.migrate_legacy()
+
+    # ---------- blocks ----------
+
+    def _block_path(self, ref):
+        return os.path.join(self.block_dir, ref[:2], ref)
+
+    def _ref(self, raw):
+        return hashlib.sha256(raw).hexdigest() + CODECS[self.codec]
+
+    def _write_block(self, ref, raw):
+        # Returns bytes written; 0 for a block some snapshot already stored
+        path = self._block_path(ref)
+        if os.path.exists(path):
+            return 0
+
+        data = _compress(self.codec, raw)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return len(data)
+
+    def _read_block(self, ref):
+        with open(self._block_path(ref), "rb") as f:
+            return json.loads(_decompress(ref, f.read()))
+
+    def _blocks_for(self, dataset, records):
+        refs, written, changed = [], 0, 0
+        for b, start in enumerate(range(0, len(records), BLOCK_RECORDS)):
+            chunk = records[start:start + BLOCK_RECORDS]
+            memo = self._memo.get((dataset, b))
+            if memo and len(memo[0]) == len(chunk) and all(x is y for x, y in zip(memo[0], chunk)):
+                refs.append(memo[1])
+                continue
+
+            raw = json.dumps(chunk, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            ref = self._ref(raw)
+            if not (memo and memo[1] == ref):
+                written += self._write_block(ref, raw)
+                changed += 1
+            self._memo[(dataset, b)] = (tuple(chunk), ref)
+            refs.append(ref)
+
+        # Forget memo entries past the end (the list shrank, e.g. after a restore)
+        for key in [k for k in self._memo if k[0] == dataset and k[1] >= len(refs)]:
+            del self._memo[key]
+
+        return refs, written, changed
+
+    # ---------- manifests ----------
+
+    def _manifest_path(self, name):
+        return os.path.join(self.manifest_dir, name)
+
+    def _write_manifest(self, name, manifest):
+        path = self._manifest_path(name)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def create(self, name, timestamp, data):
+        # data: {"health_log": [...], "ocr": [...]}
+        with self._lock:
+            manifest = {"name": name, "timestamp": timestamp, "codec": self.codec,
+                        "counts": {}, "blocks": {}, "new_blocks": 0, "new_bytes": 0}
+            for ds in DATASETS:
+                records = data.get(ds, [])
+                refs, written, changed = self._blocks_for(ds, records)
+                manifest["counts"][ds] = len(records)
+                manifest["blocks"][ds] = refs
+                manifest["new_blocks"] += changed
+                manifest["new_bytes"] += written
+
+            self._write_manifest(name, manifest)
+            return manifest
+
+    def list(self):
+        # Manifest metadata only — block bodies are never read here
+        out = []
+        for name in sorted(os.listdir(self.manifest_dir)):
+            if name.endswith(".tmp"):
+                continue
+            with open(self._manifest_path(name), "r", encoding="utf-8") as f:
+                m = json.load(f)
+            m.pop("blocks", None)
+            out.append(m)
+        return out
+
+    def load(self, name):
+        with open(self._manifest_path(name), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        snap = {"timestamp": manifest["timestamp"]}
+        for ds in DATASETS:
+            records = []
+            for ref in manifest["blocks"].get(ds, []):
+                records.extend(self._read_block(ref))
+            snap[ds] = records
+        return snap
+
+    def delete(self, name):
+        with self._lock:
+            os.remove(self._manifest_path(name))
+            self.gc()
+
+    def gc(self):
+        # Remove blocks no manifest refers to; returns the number removed
+        live = set()
+        for name in os.listdir(self.manifest_dir):
+            if name.endswith(".tmp"):
+                continue
+            with open(self._manifest_path(name), "r", encoding="utf-8") as f:
+                for refs in json.load(f)["blocks"].values():
+                    live.update(refs)
+
+        removed = 0
+        for root, _, names in os.walk(self.block_dir):
+            for n in names:
+                if n not in live:
+                    os.remove(os.path.join(root, n))
+                    removed += 1
+        self._memo = {k: v for k, v in self._memo.items() if v[1] in live}
+        return removed
+
+    def disk_usage(self):
+        total = 0
+        for root, _, names in os.walk(self.root):
+            for n in names:
+                total += os.path.getsize(os.path.join(root, n))
+        return total
+
+    # ---------- legacy ----------
+
+    def migrate_legacy(self):
+        # snapshot_*.json full copies written by the previous save_snapshot
+        for name in sorted(os.listdir(self.root)):
+            path = os.path.join(self.root, name)
+            if not (name.endswith(".json") and os.path.isfile(path)):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+            self.create(name, snap.get("timestamp", ""), snap)
+            os.remove(path)
@@ -0,0 +1,375 @@
+# ============================================================
+# AAA — SQLITE STORAGE ENGINE (optional)
+# WAL MODE • INDEXED LOG / OCR TABLES • JSON IMPORT
+# ============================================================
+#
+# Enable with AAA_STORAGE_ENGINE=sqlite. SqliteStore exposes the same
+# load/append/save/query/count/scan interface as storage.DataStore, so
+# the pages don't care which engine is active.
+#
+# Import existing JSON data once with:
+#
+#   python sqlite_store.py import --db aaa_health.db
+
+import argparse
+import json
+import os
+import re
+
+import sqlite_util
+import storage
+
+DB_FILE = "aaa_health.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_entries (
+    id        INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL DEFAULT '',
+    date      TEXT NOT NULL DEFAULT '',
+    notes     TEXT NOT NULL DEFAULT '',
+    extra     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_log_date      ON log_entries(date);
+CREATE INDEX IF NOT EXISTS idx_log_timestamp ON log_entries(timestamp);
+
+CREATE TABLE IF NOT EXISTS ocr_extractions (
+    id        INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL DEFAULT '',
+    filename  TEXT NOT NULL DEFAULT '',
+    paged     INTEGER NOT NULL DEFAULT 0,
+    extra     TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_ocr_timestamp ON ocr_extractions(timestamp);
+CREATE INDEX IF NOT EXISTS idx_ocr_filename  ON ocr_extractions(filename);
+
+CREATE TABLE IF NOT EXISTS versions (
+    kind    TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ocr_pages (
+    extraction_id INTEGER NOT NULL REFERENCES ocr_extractions(id) ON DELETE CASCADE,
+    page          INTEGER NOT NULL,
+    text          TEXT NOT NULL DEFAULT '',
+    PRIMARY KEY (extraction_id, page)
+);
+"""
+
+LOG_FIELDS = ("timestamp", "date", "notes")
+OCR_FIELDS = ("timestamp", "filename", "text")
+
+# Matches the page separator page_ocr writes between PDF pages
+PAGE_MARK = re.compile(r"\n\n--- PAGE (\d+) ---\n")
+
+
+# ============================================================
+# RECORD <-> ROW
+# ============================================================
+
+def _extra(record, known):
+    rest = {k: v for k, v in record.items() if k not in known}
+    return json.dumps(rest, ensure_ascii=False) if rest else None
+
+
+def _with_extra(record, extra):
+    if extra:
+        record.update(json.loads(extra))
+    return record
+
+
+def _range_clause(start, end, field="timestamp"):
+    # WHERE clause + args for start <= field < end
+    where, args = [], []
+    if start is not None:
+        where.append(f"{field} >= ?")
+        args.append(start)
+    if end is not None:
+        where.append(f"{field} < ?")
+        args.append(end)
+    return ("WHERE " + " AND ".join(where)) if where else "", args
+
+
+def split_pages(text):
+    # Returns (paged, [(page_no, text), ...]); paged texts round-trip exactly
+    parts = PAGE_MARK.split(text or "")
+    if len(parts) < 3 or parts[0] != "":
+        return False, [(1, text or "")]
+    return True, [(int(parts[i]), parts[i + 1]) for i in range(1, len(parts), 2)]
+
+
+def join_pages(paged, pages):
+    if not paged:
+        return pages[0][1] if pages else ""
+    return "".join(f"\n\n--- PAGE {n} ---\n{t}" for n, t in pages)
+
+
+# ============================================================
+# STORE
+# ============================================================
+
+class SqliteStore:
+    def __init__(self, db_path, log_path, ocr_path):
+        self.db_path = db_path
+        self.kinds = {
+            os.path.abspath(log_path): "log",
+            os.path.abspath(ocr_path): "ocr",
+        }
+        # Anything that isn't a log/OCR list still lives in JSON
+        self.fallback = storage.DataStore()
+        self._conn = sqlite_util.LocalConnection(self.db_path, foreign_keys=True)
+        self.queries = 0
+
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _kind(self, path):
+        return self.kinds.get(os.path.abspath(path))
+
+    # ---------- writes ----------
+
+    def _insert(self, conn, kind, record):
+        if kind == "log":
+            conn.execute(
+                "INSERT INTO log_entries (timestamp, date, notes, extra) VALUES (?, ?, ?, ?)",
+                (record.get("timestamp", ""), record.get("date", ""),
+                 record.get("notes", ""), _extra(record, LOG_FIELDS)),
+            )
+        else:
+            paged, pages = split_pages(record.get("text", ""))
+            cur = conn.execute(
+                "INSERT INTO ocr_extractions (timestamp, filename, paged, extra) VALUES (?, ?, ?, ?)",
+                (record.get("timestamp", ""), record.get("filename", ""),
+                 int(paged), _extra(record, OCR_FIELDS)),
+            )
+            conn.executemany(
+                "INSERT INTO ocr_pages (extraction_id, page, text) VALUES (?, ?, ?)",
+                [(cur.lastrowid, n, t) for n, t in pages],
+            )
+
+    # Same version-counter semantics as storage.save_json: every write bumps
+    # the kind's counter in the same transaction
+
+    def _version(self, conn, kind):
+        row = conn.execute("SELECT version FROM versions WHERE kind = ?", (kind,)).fetchone()
+        return row[0] if row else 0
+
+    def _bump(self, conn, kind):
+        conn.execute(
+            "INSERT INTO versions (kind, version) VALUES (?, 1) "
+            "ON CONFLICT(kind) DO UPDATE SET version = version + 1",
+            (kind,),
+        )
+        return self._version(conn, kind)
+
+    def append(self, path, record):
+        kind = self._kind(path)
+        if kind is None:
+            return self.fallback.append(path, record)
+        with self._conn() as conn:
+            self._insert(conn, kind, record)
+            self._bump(conn, kind)
+
+    def save(self, path, data, expected_version=None):
+        kind = self._kind(path)
+        if kind is None:
+            return self.fallback.save(path, data, expected_version)
+        with self._conn() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if expected_version is not None:
+                actual = self._version(conn, kind)
+                if actual != expected_version:
+                    raise storage.VersionConflict(path, expected_version, actual)
+            if kind == "log":
+                conn.execute("DELETE FROM log_entries")
+            else:
+                conn.execute("DELETE FROM ocr_pages")
+                conn.execute("DELETE FROM ocr_extractions")
+            for record in data:
+                self._insert(conn, kind, record)
+            return self._bump(conn, kind)
+
+    def load_versioned(self, path, default):
+        kind = self._kind(path)
+        if kind is None:
+            return self.fallback.load_versioned(path, default)
+        conn = self._conn()
+        conn.execute("BEGIN")   # one read snapshot for the rows and the version
+        try:
+            return self.load(path, default), self._version(conn, kind)
+        finally:
+            conn.commit()
+
+    def update(self, path, fn, default=None):
+        # Read-modify-write; retried if another writer got in between
+        while True:
+            data, version = self.load_versioned(path, default)
+            data = fn(data)
+            try:
+                self.save(path, data, version)
+                return data
+            except storage.VersionConflict:
+                continue
+
+    # ---------- reads ----------
+
+    def _log_rows(self, sql, args, with_ids=False):
+        rows = self._conn().execute(
+            f"SELECT id, timestamp, date, notes, extra FROM log_entries {sql}", args
+        ).fetchall()
+        records = [_with_extra({"timestamp": t, "date": d, "notes": n}, e) for _, t, d, n, e in rows]
+        return list(zip([r[0] for r in rows], records)) if with_ids else records
+
+    def _ocr_rows(self, sql, args, with_ids=False):
+        rows = self._conn().execute(
+            f"SELECT id, timestamp, filename, paged, extra FROM ocr_extractions {sql}", args
+        ).fetchall()
+        if not rows:
+            return []
+
+        ids = [r[0] for r in rows]
+        pages = {}
+        # Batched to stay under SQLite's bound-parameter limit on full loads
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            marks = ",".join("?" * len(batch))
+            for eid, n, t in self._conn().execute(
+                f"SELECT extraction_id, page, text FROM ocr_pages "
+                f"WHERE extraction_id IN ({marks}) ORDER BY extraction_id, page",
+                batch,
+            ):
+                pages.setdefault(eid, []).append((n, t))
+
+        records = [
+            _with_extra({"timestamp": ts, "filename": fn,
+                         "text": join_pages(paged, pages.get(eid, []))}, e)
+            for eid, ts, fn, paged, e in rows
+        ]
+        return list(zip(ids, records)) if with_ids else records
+
+    def load(self, path, default):
+        kind = self._kind(path)
+        if kind is None:
+            return self.fallback.load(path, default)
+        self.queries += 1
+        if kind == "log":
+            return self._log_rows("ORDER BY id", ())
+        return self._ocr_rows("ORDER BY id", ())
+
+    def _by(self, kind, by):
+        # Only real columns can be ordered / filtered on
+        if by is None:
+            return "timestamp"
+        if by not in (("timestamp", "date") if kind == "log" else ("timestamp",)):
+            raise ValueError(f"Can't order {kind} records by {by!r}")
+        return by
+
+    def count(self, path, start=None, end=None, by=None):
+        kind = self._kind(path)
+        if kind is None:
+            return self.fallback.count(path, start, end, by)
+        table = "log_entries" if kind == "log" else "ocr_extractions"
+        where, args = _range_clause(start, end, self._by(kind, by))
+        self.queries += 1
+        return self._conn().execute(f"SELECT COUNT(*) FROM {table} {where}", args).fetchone()[0]
+
+    def query(self, path, offset=0, limit=None, newest_first=True):
+        # One page of records, ordered by insertion (newest first by default)
+        kind = self._kind(path)
+        if kind is None:
+            return self.fallback.query(path, offset, limit, newest_first)
+        self.queries += 1
+        sql = f"ORDER BY id {'DESC' if newest_first else 'ASC'} LIMIT ? OFFSET ?"
+        args = (-1 if limit is None else limit, offset)
+        if kind == "log":
+            return self._log_rows(sql, args)
+        return self._ocr_rows(sql, args)
+
+    def scan(self, path, limit, cursor=None, newest_first=True, start=None, end=None, by=None):
+        # Keyset page: up to `limit` (id, record) pairs after id `cursor`,
+        # optionally limited to timestamps in [start, end). With by=<column>
+        # (log "date"), rows are ordered and filtered by that column through
+        # its index, and positions are (value, id) pairs.
+        kind = self._kind(path)
+        if kind is None:
+            return self.fallback.scan(path, limit, cursor, newest_first, start, end, by)
+        order = "DESC" if newest_first else "ASC"
+        where, args = _range_clause(start, end, self._by(kind, by))
+        if cursor is not None:
+            op = "<" if newest_first else ">"
+            where += " AND " if where else "WHERE "
+            if by is None:
+                where += f"id {op} ?"
+                args.append(cursor)
+            else:
+                where += f"({by}, id) {op} (?, ?)"
+                args.extend(cursor)
+        keys = "id" if by is None else f"{by} {order}, id"
+        sql = f"{where} ORDER BY {keys} {order} LIMIT ?"
+        args.append(limit)
+
+        self.queries += 1
+        fetch = self._log_rows if kind == "log" else self._ocr_rows
+        rows = fetch(sql, args, with_ids=True)
+        if by is None:
+            return rows
+        return [((rec[by], rid), rec) for rid, rec in rows]
+
+    # ---------- legacy snapshots ----------
+
+    def legacy_snapshots(self):
+        # [(name, timestamp, data)] from the snapshots table older versions
+        # kept in the database. Snapshots now live in snapshots.SnapshotStore
+        # for both engines; the app moves these over and then drops the table.
+        conn = self._conn()
+        if not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'snapshots'"
+        ).fetchone():
+            return []
+        return [
+            (name, ts, {"health_log": json.loads(log), "ocr": json.loads(ocr)})
+            for name, ts, log, ocr in conn.execute(
+                "SELECT name, timestamp, health_log, ocr FROM snapshots ORDER BY name"
+            )
+        ]
+
+    def drop_legacy_snapshots(self):
+        with self._conn() as conn:
+            conn.execute("DROP TABLE IF EXISTS snapshots")
+
+    def stats(self):
+        stats = self.fallback.stats()
+        stats["queries"] = self.queries
+        return stats
+
+
+# ============================================================
+# IMPORT TOOL
+# ============================================================
+
+# Snapshots are engine-independent (see snapshots.py) and are not imported;
+# SnapshotStore converts snapshot_*.json files in place on first use.
+
+def import_json(db_path, log_path, ocr_path):
+    store = SqliteStore(db_path, log_path, ocr_path)
+
+    logs = storage.load_json(log_path, [])
+    ocr = storage.load_json(ocr_path, [])
+    store.save(log_path, logs)
+    store.save(ocr_path, ocr)
+
+    return len(logs), len(ocr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AAA SQLite storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    imp = sub.add_parser("import", help="Load the JSON data files into SQLite")
+    imp.add_argument("--db", default=DB_FILE)
+    imp.add_argument("--log", default="health_log.json")
+    imp.add_argument("--ocr", default="ocr_results.json")
+
+    args = parser.parse_args()
+
+    n_log, n_ocr = import_json(args.db, args.log, args.ocr)
+    print(f"\n✔ Imported {n_log} log entries, {n_ocr} OCR results into {args.db}\n")
@@ -0,0 +1,41 @@
+# ============================================================
+# AAA — SHARED SQLITE CONNECTIONS
+# ONE CONNECTION PER THREAD • WAL • SAME PRAGMAS EVERYWHERE
+# ============================================================
+#
+# Every SQLite-backed module (storage engine, search index, OCR cache, AI
+# results, job queue, timeline) opens its database through this, so timeouts
+# and pragmas are set in one place. sqlite3 connections can't be shared
+# between threads, so each thread gets its own, opened on first use.
+
+import sqlite3
+import threading
+
+BUSY_TIMEOUT = 30
+
+
+class LocalConnection:
+    # Call it to get the calling thread's connection:
+    #
+    #   self._conn = LocalConnection(db_path)
+    #   with self._conn() as conn: ...
+    #
+    # isolation_level=None gives autocommit (explicit BEGIN IMMEDIATE);
+    # foreign_keys=True turns on FOREIGN KEY enforcement.
+    def __init__(self, db_path, isolation_level="", foreign_keys=False):
+        self.db_path = db_path
+        self.isolation_level = isolation_level
+        self.foreign_keys = foreign_keys
+        self._local = threading.local()
+
+    def __call__(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT,
+                                   isolation_level=self.isolation_level)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            if self.foreign_keys:
+                conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,80 @@
+# ============================================================
+# AAA — STATIC ASSETS
+# RESIZED VARIANTS • BUILT ONCE • SERVED AS STATIC FILES
+# ============================================================
+#
+# The source logo is a 1024 px, 1.4 MB PNG shown at 150 px. At startup each
+# asset is resized to the size it is displayed at (2× for high-DPI screens),
+# optimised, written to static/ and kept in memory. Streamlit serves static/
+# over plain HTTP (server.enableStaticServing in .streamlit/config.toml), so
+# a page only sends a short <img src=...> and the browser caches the file,
+# instead of a base64 copy of the original on every rerun.
+#
+# Variants are rebuilt only when their source file is newer, so Pillow is
+# only imported when one actually has to be rebuilt.
+
+import io
+import os
+import threading
+
+ASSET_DIR = "assets"
+STATIC_DIR = "static"
+STATIC_URL = "app/static"
+
+# name: (source file, long side in px)
+VARIANTS = {
+    "logo": ("logo.png", 300),        # displayed at 150 px
+}
+
+_built = {}
+_lock = threading.Lock()
+
+
+def _build(name, src_dir, out_dir):
+    source, size = VARIANTS[name]
+    src = os.path.join(src_dir, source)
+    out = os.path.join(out_dir, f"{name}_{size}.png")
+
+    if not os.path.exists(out) or os.path.getmtime(out) < os.path.getmtime(src):
+        from PIL import Image
+        with Image.open(src) as img:
+            img = img.convert("RGBA")
+            img.thumbnail((size, size), Image.LANCZOS)
+            buf = io.BytesIO()
+            img.save(buf, "PNG", optimize=True)
+        tmp = out + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(buf.getvalue())
+        os.replace(tmp, out)
+
+    with open(out, "rb") as f:
+        data = f.read()
+    return {
+        "path": out,
+        "url": f"{STATIC_URL}/{os.path.basename(out)}",
+        "data": data,
+        "bytes": len(data),
+        "source_bytes": os.path.getsize(src),
+    }
+
+
+def asset(name, src_dir=ASSET_DIR, out_dir=STATIC_DIR):
+    # {"path", "url", "data", "bytes", "source_bytes"} for one variant
+    with _lock:
+        if name not in _built:
+            os.makedirs(out_dir, exist_ok=True)
+            _built[name] = _build(name, src_dir, out_dir)
+        return _built[name]
+
+
+def img_tag(name, width):
+    return f'<img src="{asset(name)["url"]}" style="width:{width}px;">'
+
+
+def payload_report(name="logo", width=150):
+    # Bytes one rerun sends for the image: base64 of the source vs. the tag
+    a = asset(name)
+    before = len(f'<img src="data:image/png;base64," style="width:{width}px;">') \
+        + 4 * -(-a["source_bytes"] // 3)
+    return {"before": before, "after": len(img_tag(name, width)),
+            "file_bytes": a["bytes"], "source_bytes": a["source_bytes"]}
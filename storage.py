@@ -0,0 +1,659 @@
+# ============================================================
+# AAA — STORAGE ENGINE
+# APPEND-ONLY JOURNAL • FSYNC'D WRITES • ATOMIC COMPACTION
+# ============================================================
+#
+# Each list file (health_log.json, ocr_results.json, ...) is stored as:
+#
+#   <path>           compacted base — the same list-of-dicts JSON as before
+#   <path>.journal   JSON Lines, one appended record per line
+#
+# Appends only touch the journal, so a save costs O(1 record) instead of
+# re-serialising the whole history. Once the journal grows past
+# COMPACT_BYTES it is folded back into the base in a background thread.
+#
+# Existing list files need no migration: they are read as the base and the
+# journal starts empty.
+#
+# DataStore sits on top and keeps one parsed copy of each file in memory,
+# invalidated when the file's inode/mtime/size changes or on a write made
+# through the store.
+#
+# Concurrency: every operation on a file holds its FileLock, which is a
+# thread lock plus an advisory flock() on <path>.lock, so several app
+# processes (or CLI tools) sharing the data directory serialise too. Each
+# write bumps a counter in <path>.version; load_versioned() returns it and
+# save_json(expected_version=...) refuses to overwrite a file that was
+# written in between (VersionConflict). update_json() does a whole
+# read-modify-write under the lock.
+#
+# File reads, writes and JSON parsing/serialising are timed as separate
+# perf spans (storage.read, storage.write, json.parse, json.dump).
+
+import bisect
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+import perf
+
+try:
+    import fcntl
+except ImportError:   # Windows: locks only cover threads of one process
+    fcntl = None
+
+JOURNAL_SUFFIX = ".journal"
+LOCK_SUFFIX = ".lock"
+VERSION_SUFFIX = ".version"
+COMPACT_BYTES = 4 * 1024 * 1024
+
+_locks = {}
+_locks_guard = threading.Lock()
+_compacting = set()
+
+
+# ============================================================
+# LOCKING + VERSIONS
+# ============================================================
+
+class VersionConflict(Exception):
+    def __init__(self, path, expected, actual):
+        super().__init__(f"{path} changed since it was read (version {expected} → {actual})")
+        self.path = path
+        self.expected = expected
+        self.actual = actual
+
+
+_lock_stats = {"acquired": 0, "contended": 0, "wait_ms": 0.0, "max_wait_ms": 0.0}
+_lock_stats_guard = threading.Lock()
+
+
+class FileLock:
+    # Reentrant per thread; exclusive across threads and, through flock() on
+    # <path>.lock, across processes. The flock is held while the outermost
+    # acquisition is. Each outermost acquisition first repairs whatever a
+    # lock holder that died (in any process) left behind; see _recover().
+    def __init__(self, path):
+        self.data_path = os.path.abspath(path)
+        self.path = self.data_path + LOCK_SUFFIX
+        self._rlock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+        self._dir_ready = False
+
+    def acquire(self):
+        start = time.perf_counter()
+        contended = not self._rlock.acquire(blocking=False)
+        if contended:
+            self._rlock.acquire()
+
+        self._depth += 1
+        if self._depth > 1:
+            return
+
+        if fcntl is not None:
+            if not self._dir_ready:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self._dir_ready = True
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                contended = True
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            self._fd = fd
+
+        try:
+            _recover(self.data_path)
+        except BaseException:
+            self.release()
+            raise
+
+        waited = (time.perf_counter() - start) * 1000
+        with _lock_stats_guard:
+            _lock_stats["acquired"] += 1
+            if contended:
+                _lock_stats["contended"] += 1
+                _lock_stats["wait_ms"] += waited
+                _lock_stats["max_wait_ms"] = max(_lock_stats["max_wait_ms"], waited)
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._rlock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def _lock_for(path):
+    key = os.path.abspath(path)
+    with _locks_guard:
+        if key not in _locks:
+            _locks[key] = FileLock(key)
+        return _locks[key]
+
+
+def file_lock(path):
+    # The lock every storage operation on `path` takes; hold it to make a
+    # sequence of operations (on one or more files) atomic
+    return _lock_for(path)
+
+
+def lock_stats():
+    with _lock_stats_guard:
+        stats = dict(_lock_stats)
+    stats["contention_rate"] = stats["contended"] / stats["acquired"] if stats["acquired"] else 0.0
+    return stats
+
+
+def _version_path(path):
+    return path + VERSION_SUFFIX
+
+
+def _read_version(path):
+    try:
+        with open(_version_path(path), "r") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _bump_version(path):
+    # Caller holds the path lock
+    version = _read_version(path) + 1
+    tmp = _version_path(path) + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(str(version))
+    os.replace(tmp, _version_path(path))
+    return version
+
+
+# ============================================================
+# LOW-LEVEL HELPERS
+# ============================================================
+
+def journal_path(path):
+    return path + JOURNAL_SUFFIX
+
+
+def _marker_path(path):
+    return path + ".compact"
+
+
+def _tmp_path(path):
+    return path + ".compact.tmp"
+
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
+
+
+def _fsync_dir(path):
+    # Make the rename itself durable (no-op where directories can't be opened)
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _write_durable(path, text):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _journal_size(path):
+    try:
+        return os.path.getsize(journal_path(path))
+    except OSError:
+        return 0
+
+
+def _journal_mark(path, nbytes):
+    # Identifies "this journal with these first nbytes": its inode and a
+    # hash of the prefix. None if there is no journal.
+    try:
+        with open(journal_path(path), "rb") as f:
+            prefix = f.read(nbytes)
+            return {"folded": nbytes, "inode": os.fstat(f.fileno()).st_ino,
+                    "sha256": hashlib.sha256(prefix).hexdigest()}
+    except FileNotFoundError:
+        return None
+
+
+def _drop_journal_prefix(path, nbytes):
+    # Remove the first `nbytes` of the journal (already folded into the base)
+    jpath = journal_path(path)
+    if not os.path.exists(jpath):
+        return
+    with open(jpath, "rb") as f:
+        f.seek(nbytes)
+        tail = f.read()
+    if not tail:
+        os.remove(jpath)
+    else:
+        tmp = jpath + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, jpath)
+    _fsync_dir(path)
+
+
+# ============================================================
+# CRASH RECOVERY
+# ============================================================
+
+def _recover(path):
+    # Finish or roll back an interrupted checkpoint and trim a torn journal
+    # tail. Both can only be left by a lock holder that died, possibly in
+    # another, still running process, so this runs on every outermost
+    # acquisition of the path's FileLock. When there is nothing to repair it
+    # costs a stat of the marker and a one-byte read of the journal's end.
+    # (A stray .compact.tmp without a marker is harmless and is overwritten
+    # by the next checkpoint.)
+    marker, tmp = _marker_path(path), _tmp_path(path)
+
+    if os.path.exists(marker):
+        if os.path.exists(tmp):
+            # Crashed before the base was replaced: journal is still authoritative
+            os.remove(tmp)
+        else:
+            # Base was replaced: the first N journal bytes are already in it,
+            # unless the drop already happened and the journal now holds only
+            # newer appends (it was replaced or removed, so its mark differs)
+            with open(marker, "r") as f:
+                mark = json.loads(f.read() or "null")
+            if isinstance(mark, dict) and _journal_mark(path, mark["folded"]) == mark:
+                _drop_journal_prefix(path, mark["folded"])
+        os.remove(marker)
+
+    try:
+        f = open(journal_path(path), "rb+")
+    except FileNotFoundError:
+        return
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        if end:
+            f.seek(end - 1)
+            if f.read(1) != b"\n":
+                f.seek(0)
+                data = f.read()
+                f.truncate(data.rfind(b"\n") + 1)
+
+
+def _checkpoint(path, data):
+    # Atomically make `data` the new base and discard the journal bytes that
+    # existed when the checkpoint started. Caller holds the path lock.
+    folded = _journal_size(path)
+    mark = _journal_mark(path, folded)
+    tmp, marker = _tmp_path(path), _marker_path(path)
+
+    name = os.path.basename(path)
+    with perf.span("json.dump", file=name) as s:
+        text = _dumps(data)
+        s.bytes = len(text)
+
+    with perf.span("storage.write", file=name) as s:
+        _write_durable(tmp, text)
+        _write_durable(marker, _dumps(mark))
+        _fsync_dir(path)
+
+        os.replace(tmp, path)
+        _fsync_dir(path)
+
+        _drop_journal_prefix(path, folded)
+        os.remove(marker)
+        _fsync_dir(path)
+        s.bytes = len(text)
+
+
+# ============================================================
+# READ / WRITE
+# ============================================================
+
+def _read_journal(path):
+    records = []
+    jpath = journal_path(path)
+    if not os.path.exists(jpath):
+        return records
+    with open(jpath, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # Torn line from a crash mid-append
+                continue
+    return records
+
+
+def read_journal(path):
+    # Records appended since the last compaction, for readers that stream
+    # the base themselves; hold file_lock(path) across both reads
+    with _lock_for(path):
+        return _read_journal(path)
+
+
+def load_json(path, default):
+    with _lock_for(path):
+
+        has_journal = os.path.exists(journal_path(path))
+        if not os.path.exists(path) and not has_journal:
+            return default
+
+        # Read and parse are separate spans, so neither is counted twice
+        name = os.path.basename(path)
+        # A journal without a base is a list that has never been compacted
+        data = [] if not os.path.exists(path) else default
+        if os.path.exists(path):
+            try:
+                with perf.span("storage.read", file=name) as s:
+                    with open(path, "r", encoding="utf-8") as f:
+                        raw = f.read()
+                    s.bytes = len(raw)
+                with perf.span("json.parse", file=name) as s:
+                    s.bytes = len(raw)
+                    data = json.loads(raw)
+            except:
+                return default
+
+        if has_journal and isinstance(data, list):
+            # Small (folded away at COMPACT_BYTES); its line parsing is included
+            with perf.span("storage.read", file=name, part="journal") as s:
+                data = data + _read_journal(path)
+                s.bytes = _journal_size(path)
+
+        return data
+
+
+def load_versioned(path, default):
+    # (data, version) read atomically; pass the version back to save_json
+    with _lock_for(path):
+        return load_json(path, default), _read_version(path)
+
+
+def save_json(path, data, expected_version=None):
+    # Full rewrite (e.g. snapshot restore) — atomic, replaces the journal.
+    # With expected_version, raises VersionConflict if the file was written
+    # since that version was read.
+    with _lock_for(path):
+        if expected_version is not None:
+            actual = _read_version(path)
+            if actual != expected_version:
+                raise VersionConflict(path, expected_version, actual)
+        _checkpoint(path, data)
+        return _bump_version(path)
+
+
+def update_json(path, fn, default=None):
+    # Read-modify-write under the lock: saves and returns fn(current data)
+    with _lock_for(path):
+        data = fn(load_json(path, default))
+        save_json(path, data)
+        return data
+
+
+def append_json(path, record):
+    # O(1) append of one record to a list file
+    with _lock_for(path):
+        line = _dumps(record) + "\n"
+        with perf.span("storage.write", file=os.path.basename(path), part="journal") as s:
+            with open(journal_path(path), "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            s.bytes = len(line)
+        size = _journal_size(path)
+        _bump_version(path)
+
+    if size >= COMPACT_BYTES:
+        compact_async(path)
+
+
+# ============================================================
+# COMPACTION
+# ============================================================
+
+def compact(path):
+    with _lock_for(path):
+        if not os.path.exists(journal_path(path)):
+            return False
+        _checkpoint(path, load_json(path, []))
+        return True
+
+
+def compact_async(path):
+    key = os.path.abspath(path)
+    with _locks_guard:
+        if key in _compacting:
+            return
+        _compacting.add(key)
+
+    def run():
+        try:
+            compact(path)
+        finally:
+            with _locks_guard:
+                _compacting.discard(key)
+
+    threading.Thread(target=run, name=f"compact:{os.path.basename(path)}", daemon=True).start()
+
+
+# ============================================================
+# CACHED DATA STORE
+# ============================================================
+
+_MISSING = object()
+
+
+def in_range(record, start=None, end=None, field="timestamp"):
+    # start <= record[field] < end; timestamps are "YYYY-MM-DD HH:MM:SS" and
+    # dates "YYYY-MM-DD" strings, so string comparison is date order
+    ts = record.get(field, "")
+    return (start is None or ts >= start) and (end is None or ts < end)
+
+
+def _copy(data):
+    # Callers get their own container so they can't mutate the cached copy
+    if isinstance(data, list):
+        return list(data)
+    if isinstance(data, dict):
+        return dict(data)
+    return data
+
+
+class DataStore:
+    def __init__(self):
+        self._cache = {}
+        # Only guards invalidate(); reads and writes use the per-file locks
+        self._guard = threading.Lock()
+        self._orders = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _signature(self, path):
+        sig = []
+        for p in (path, journal_path(path)):
+            try:
+                s = os.stat(p)
+                sig.append((s.st_ino, s.st_mtime_ns, s.st_size))
+            except OSError:
+                sig.append(None)
+        return tuple(sig)
+
+    def _data(self, path):
+        # The cached object itself — callers must not mutate it
+        key = os.path.abspath(path)
+        with _lock_for(path):
+            # Stat before reading: if the file changes mid-read the stored
+            # signature is stale and the next load simply re-parses
+            sig = self._signature(path)
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == sig:
+                self.hits += 1
+                data = entry[1]
+            else:
+                self.misses += 1
+                data = load_json(path, _MISSING)
+                self._cache[key] = (sig, data)
+        return data
+
+    def load(self, path, default):
+        data = self._data(path)
+        return default if data is _MISSING else _copy(data)
+
+    def _list(self, path):
+        data = self._data(path)
+        return data if isinstance(data, list) else []
+
+    def append(self, path, record):
+        key = os.path.abspath(path)
+        with _lock_for(path):
+            before = self._signature(path)
+            append_json(path, record)
+
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == before and isinstance(entry[1], list):
+                entry[1].append(record)
+                self._cache[key] = (self._signature(path), entry[1])
+            else:
+                self._cache.pop(key, None)
+
+    def save(self, path, data, expected_version=None):
+        key = os.path.abspath(path)
+        with _lock_for(path):
+            version = save_json(path, data, expected_version)
+            self._cache[key] = (self._signature(path), _copy(data))
+            return version
+
+    def load_versioned(self, path, default):
+        with _lock_for(path):
+            return self.load(path, default), _read_version(path)
+
+    def update(self, path, fn, default=None):
+        # Read-modify-write under the file lock; returns the saved data
+        with _lock_for(path):
+            data = fn(self.load(path, default))
+            self.save(path, data)
+            return data
+
+    def _order(self, path, field):
+        # [(record[field], position)] sorted; rebuilt when the cached list is
+        # replaced, extended in place when records were only appended to it
+        data = self._list(path)
+        key = (os.path.abspath(path), field)
+        entry = self._orders.get(key)
+        if entry is not None and entry[0] is data and entry[1] <= len(data):
+            order = entry[2]
+            for i in range(entry[1], len(data)):
+                bisect.insort(order, (data[i].get(field, ""), i))
+        else:
+            order = sorted((r.get(field, ""), i) for i, r in enumerate(data))
+        self._orders[key] = (data, len(data), order)
+        return data, order
+
+    def _bounds(self, order, start, end):
+        lo = 0 if start is None else bisect.bisect_left(order, (start,))
+        hi = len(order) if end is None else bisect.bisect_left(order, (end,))
+        return lo, hi
+
+    def count(self, path, start=None, end=None, by=None):
+        # by: field the range applies to (default: timestamp)
+        if start is None and end is None:
+            return len(self._list(path))
+        _, order = self._order(path, by or "timestamp")
+        lo, hi = self._bounds(order, start, end)
+        return max(0, hi - lo)
+
+    def query(self, path, offset=0, limit=None, newest_first=True):
+        # One page of records, ordered by insertion (newest first by default)
+        data = self.load(path, [])
+        if newest_first:
+            data.reverse()
+        end = None if limit is None else offset + limit
+        return data[offset:end]
+
+    def scan(self, path, limit, cursor=None, newest_first=True, start=None, end=None, by=None):
+        # Keyset page: up to `limit` (position, record) pairs after position
+        # `cursor`, optionally limited to timestamps in [start, end).
+        # With by=<field>, records are ordered and filtered by that field
+        # through a sorted index, and positions are (value, index) pairs;
+        # pages that filter should pass by, since without it records are in
+        # insertion order and the filter is a linear walk.
+        if by is not None:
+            data, order = self._order(path, by)
+            lo, hi = self._bounds(order, start, end)
+            if newest_first:
+                if cursor is not None:
+                    hi = min(hi, bisect.bisect_left(order, tuple(cursor)))
+                keys = order[max(lo, hi - limit):hi][::-1]
+            else:
+                if cursor is not None:
+                    lo = max(lo, bisect.bisect_right(order, tuple(cursor)))
+                keys = order[lo:min(hi, lo + limit)]
+            return [(k, data[k[1]]) for k in keys]
+
+        data = self._list(path)
+        step = -1 if newest_first else 1
+        if cursor is None:
+            i = len(data) - 1 if newest_first else 0
+        else:
+            i = cursor + step
+
+        page = []
+        while 0 <= i < len(data) and len(page) < limit:
+            if in_range(data[i], start, end):
+                page.append((i, data[i]))
+            i += step
+        return page
+
+    def invalidate(self, path=None):
+        with self._guard:
+            if path is None:
+                self._cache.clear()
+            else:
+                self._cache.pop(os.path.abspath(path), None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total) if total else 0.0,
+            "files": len(self._cache),
+        }
+
+
+# ============================================================
+# CLI — python storage.py compact health_log.json ocr_results.json
+# ============================================================
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "compact":
+        print("usage: python storage.py compact FILE [FILE ...]")
+        sys.exit(1)
+
+    for p in sys.argv[2:]:
+        print(("✔ compacted " if compact(p) else "• nothing to compact in ") + p)
@@ -0,0 +1,160 @@
+# ============================================================
+# AAA — STORAGE STRESS TEST
+# N PARALLEL WRITER PROCESSES • LOST-UPDATE CHECK • LOCK CONTENTION
+# ============================================================
+#
+#   python storage_stress.py --writers 8 --ops 200
+#
+# Runs three workloads against a scratch directory, each with --writers
+# processes (and --threads threads per process) hammering the same file:
+#
+#   append   DataStore.append of uniquely numbered records, with compaction
+#            forced often; every record must be there exactly once
+#   update   read-modify-write of one counter via DataStore.update
+#   cas      load_versioned + save(expected_version), retried on
+#            VersionConflict
+#
+# The counter must end at writers × threads × ops for update and cas.
+# Exits non-zero if any update was lost.
+
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import storage
+
+COMPACT_BYTES = 32 * 1024   # small, so compactions race with appends
+
+
+def _append_worker(path, writer, threads, ops):
+    store = storage.DataStore()
+
+    def run(t):
+        for seq in range(ops):
+            store.append(path, {"writer": writer, "thread": t, "seq": seq})
+
+    return _run_threads(run, threads), 0
+
+
+def _update_worker(path, writer, threads, ops):
+    store = storage.DataStore()
+
+    def run(_):
+        for _ in range(ops):
+            store.update(path, lambda d: {"n": d["n"] + 1}, {"n": 0})
+
+    return _run_threads(run, threads), 0
+
+
+def _cas_worker(path, writer, threads, ops):
+    store = storage.DataStore()
+    retries = [0]
+    retries_lock = threading.Lock()
+
+    def run(_):
+        for _ in range(ops):
+            while True:
+                data, version = store.load_versioned(path, {"n": 0})
+                try:
+                    store.save(path, {"n": data["n"] + 1}, version)
+                    break
+                except storage.VersionConflict:
+                    with retries_lock:
+                        retries[0] += 1
+
+    return _run_threads(run, threads), retries[0]
+
+
+def _run_threads(fn, threads):
+    pool = [threading.Thread(target=fn, args=(t,)) for t in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return storage.lock_stats()
+
+
+WORKERS = {"append": _append_worker, "update": _update_worker, "cas": _cas_worker}
+
+
+def _worker(args):
+    mode, path, writer, threads, ops = args
+    storage.COMPACT_BYTES = COMPACT_BYTES
+    return WORKERS[mode](path, writer, threads, ops)
+
+
+def check(mode, path, writers, threads, ops):
+    # Returns the number of lost (or duplicated) updates
+    expected = writers * threads * ops
+    data = storage.load_json(path, None)
+    if mode == "append":
+        seen = {(r["writer"], r["thread"], r["seq"]) for r in data}
+        return abs(expected - len(seen)) + (len(data) - len(seen))
+    return expected - data["n"]
+
+
+def run(mode, root, writers, threads, ops):
+    path = os.path.join(root, f"{mode}.json")
+    start = time.perf_counter()
+    with multiprocessing.Pool(writers) as pool:
+        results = pool.map(_worker, [(mode, path, w, threads, ops) for w in range(writers)])
+    elapsed = time.perf_counter() - start
+
+    total_ops = writers * threads * ops
+    acquired = sum(s["acquired"] for s, _ in results)
+    contended = sum(s["contended"] for s, _ in results)
+    wait_ms = sum(s["wait_ms"] for s, _ in results)
+    return {
+        "mode": mode,
+        "ops": total_ops,
+        "seconds": elapsed,
+        "ops_per_s": total_ops / elapsed if elapsed else 0.0,
+        "lost": check(mode, path, writers, threads, ops),
+        "lock_acquisitions": acquired,
+        "contended": contended,
+        "contention_rate": contended / acquired if acquired else 0.0,
+        "avg_wait_ms": wait_ms / contended if contended else 0.0,
+        "max_wait_ms": max(s["max_wait_ms"] for s, _ in results),
+        "cas_retries": sum(r for _, r in results),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent writer stress test for storage.py")
+    parser.add_argument("--writers", type=int, default=8, help="writer processes")
+    parser.add_argument("--threads", type=int, default=2, help="threads per writer process")
+    parser.add_argument("--ops", type=int, default=100, help="operations per thread")
+    parser.add_argument("--modes", default="append,update,cas")
+    parser.add_argument("--dir", help="scratch directory (default: a new temp dir)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    root = args.dir or tempfile.mkdtemp(prefix="aaa_stress_")
+    os.makedirs(root, exist_ok=True)
+    try:
+        results = [run(m, root, args.writers, args.threads, args.ops) for m in args.modes.split(",")]
+    finally:
+        if not args.dir:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"\n{args.writers} processes × {args.threads} threads × {args.ops} ops\n")
+        for r in results:
+            status = "✔" if r["lost"] == 0 else "✖"
+            print(f"{status} {r['mode']:<7} {r['ops']:,} ops in {r['seconds']:.2f}s "
+                  f"({r['ops_per_s']:,.0f}/s) • lost {r['lost']} • "
+                  f"contended {r['contended']:,}/{r['lock_acquisitions']:,} "
+                  f"({r['contention_rate']:.0%}), avg wait {r['avg_wait_ms']:.1f} ms, "
+                  f"max {r['max_wait_ms']:.1f} ms"
+                  + (f" • {r['cas_retries']:,} CAS retries" if r["mode"] == "cas" else ""))
+        print()
+
+    sys.exit(1 if any(r["lost"] for r in results) else 0)
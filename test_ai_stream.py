@@ -0,0 +1,35 @@
+from ai_stream import stream_generate
+from model_client import ModelClient, StubModel
+
+
+def test_ttft_is_time_to_first_chunk():
+    model = StubModel("summary", latency=0.2, chunk_delay=0.01)
+    seen = []
+
+    result = stream_generate(model, "some health log text", seen.append)
+
+    assert 200 <= result.ttft_ms < result.total_ms
+    assert result.total_ms >= result.ttft_ms + 10
+    assert len(seen) > 1
+    assert all(b.startswith(a) for a, b in zip(seen, seen[1:]))
+    assert result.text == seen[-1] == model.generate_content("some health log text").text
+    assert result.input_tokens is not None and result.output_tokens is not None
+
+
+def test_should_stop_cancels_after_the_current_chunk():
+    result = stream_generate(StubModel("summary"), "text", should_stop=lambda: True)
+
+    assert result.cancelled
+    assert result.ttft_ms is not None
+    assert result.text and result.text != StubModel("summary").generate_content("text").text
+    assert result.input_tokens is None
+
+
+def test_streams_through_model_client():
+    client = ModelClient("summary", StubModel("summary", latency=0.05), backoff=0)
+
+    result = stream_generate(client, "text")
+
+    assert result.ttft_ms >= 50
+    assert result.text == StubModel("summary").generate_content("text").text
+    assert client.stats()["calls"] == 1
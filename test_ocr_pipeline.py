@@ -0,0 +1,60 @@
+import time
+
+import pytest
+
+from model_client import StubModel
+from ocr_cache import OcrCache
+from ocr_pipeline import OcrFailed, join_pages, run_ocr
+
+
+class SlowFirstPages(StubModel):
+    # Page n's image is n bytes long; earlier pages answer later, so the
+    # pool finishes them out of order
+    def generate_content(self, contents, stream=False, **kwargs):
+        time.sleep(0.02 * (10 - len(contents[-1])))
+        return super().generate_content(contents, stream, **kwargs)
+
+
+def pages(n):
+    return ((i, bytes(i)) for i in range(1, n + 1))
+
+
+def test_results_come_back_in_page_order():
+    finished = []
+
+    def progress(page_no, status, done, total):
+        if status == "done":
+            finished.append(page_no)
+
+    results = run_ocr(pages(6), SlowFirstPages("ocr"), total=6, concurrency=6,
+                      on_progress=progress)
+
+    assert finished != sorted(finished)
+    assert [n for n, _ in results] == [1, 2, 3, 4, 5, 6]
+    for n, text in results:
+        assert f": {n} bytes of image data]" in text
+    assert join_pages(results).startswith("\n\n--- PAGE 1 ---\n")
+
+
+def test_failed_page_raises_after_the_others_finish(tmp_path):
+    cache = OcrCache(str(tmp_path / "ocr_cache.db"))
+    model = StubModel("ocr", fail_first=1)
+
+    with pytest.raises(OcrFailed) as exc:
+        run_ocr(pages(3), model, total=3, concurrency=1, retries=0, cache=cache)
+
+    assert set(exc.value.failed) == {1}
+    assert [n for n, _ in exc.value.results] == [2, 3]
+    assert "page(s) 1" in str(exc.value)
+
+    # The pages that worked were cached; running again only re-sends page 1
+    results = run_ocr(pages(3), model, total=3, concurrency=1, retries=0, cache=cache)
+    assert [n for n, _ in results] == [1, 2, 3]
+    assert model.calls == 4
+
+
+def test_retries_recover_a_failing_call():
+    model = StubModel("ocr", fail_first=1)
+    results = run_ocr(pages(1), model, total=1, retries=1, backoff=0)
+    assert [n for n, _ in results] == [1]
+    assert model.calls == 2
@@ -0,0 +1,173 @@
+# ============================================================
+# AAA — TIMELINE INDEX
+# ONE TIMESTAMP-ORDERED INDEX • INCREMENTAL UPDATES • RANGE QUERIES
+# ============================================================
+#
+# Every dated thing the app knows about (log entries, OCR results, photos,
+# audio notes, summaries) has one row here, ordered by an index on
+# (timestamp, kind, id). The merged view reads a page of it with a keyset
+# query instead of loading and sorting every source on each rerun.
+#
+# Rows are keyed by (source, content hash), so adding the same record
+# twice is a no-op. Pages add rows as they write. sync_source() brings a
+# whole source up to date by inserting only the records that are new and
+# deleting only the ones that disappeared, which is what
+# merge_health_data.py and snapshot restores use.
+
+import hashlib
+import heapq
+import json
+
+import sqlite_util
+
+TIMELINE_FILE = "timeline.db"
+
+KINDS = ("log", "ocr", "photo", "audio", "summary")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id        INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL DEFAULT '',
+    kind      TEXT NOT NULL,
+    source    TEXT NOT NULL,
+    key       TEXT NOT NULL,
+    record    TEXT NOT NULL,
+    UNIQUE (source, key)
+);
+CREATE INDEX IF NOT EXISTS idx_events_order ON events(timestamp, kind, id);
+
+CREATE TABLE IF NOT EXISTS sources (
+    source    TEXT PRIMARY KEY,
+    signature TEXT
+);
+"""
+
+
+def event_key(kind, record):
+    blob = json.dumps(record, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{kind}\0{blob}".encode("utf-8")).hexdigest()
+
+
+def merge_streams(*streams, newest_first=False):
+    # Lazily merges streams that are each already ordered by timestamp;
+    # items are records or (kind, record) pairs
+    def ts(item):
+        record = item[-1] if isinstance(item, tuple) else item
+        return record.get("timestamp", "")
+    return heapq.merge(*streams, key=ts, reverse=newest_first)
+
+
+class TimelineIndex:
+    def __init__(self, db_path=TIMELINE_FILE):
+        self.db_path = db_path
+        self._conn = sqlite_util.LocalConnection(self.db_path)
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    # ---------- writes ----------
+
+    def _insert(self, conn, kind, source, records):
+        cur = conn.executemany(
+            "INSERT OR IGNORE INTO events (timestamp, kind, source, key, record) VALUES (?, ?, ?, ?, ?)",
+            [(r.get("timestamp", ""), kind, source, event_key(kind, r),
+              json.dumps(r, ensure_ascii=False)) for r in records],
+        )
+        return cur.rowcount
+
+    def add(self, kind, record, source):
+        with self._conn() as conn:
+            self._insert(conn, kind, source, [record])
+
+    def sync_source(self, source, kind, records, signature=None, batch=500):
+        # Makes the rows for `source` match `records` (any iterable, consumed
+        # in batches); returns (added, removed)
+        added, seen, pending = 0, set(), []
+        with self._conn() as conn:
+            have = {k for (k,) in conn.execute("SELECT key FROM events WHERE source = ?", (source,))}
+
+            def flush():
+                nonlocal added
+                added += self._insert(conn, kind, source, pending)
+                pending.clear()
+
+            for r in records:
+                key = event_key(kind, r)
+                if key not in have and key not in seen:
+                    pending.append(r)
+                    if len(pending) >= batch:
+                        flush()
+                seen.add(key)
+            flush()
+
+            gone = list(have - seen)
+            for i in range(0, len(gone), 500):
+                chunk = gone[i:i + 500]
+                conn.execute(
+                    f"DELETE FROM events WHERE source = ? AND key IN ({','.join('?' * len(chunk))})",
+                    [source] + chunk,
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO sources (source, signature) VALUES (?, ?)",
+                (source, signature),
+            )
+        return added, len(gone)
+
+    def signature(self, source):
+        # What sync_source() was last given for `source`, or None
+        row = self._conn().execute(
+            "SELECT signature FROM sources WHERE source = ?", (source,)
+        ).fetchone()
+        return row[0] if row else None
+
+    # ---------- reads ----------
+
+    def _where(self, start, end, kinds):
+        where, args = [], []
+        if start is not None:
+            where.append("timestamp >= ?")
+            args.append(start)
+        if end is not None:
+            where.append("timestamp < ?")
+            args.append(end)
+        if kinds is not None:
+            # None means every kind; an empty selection matches nothing
+            where.append(f"kind IN ({','.join('?' * len(kinds))})" if kinds else "0")
+            args.extend(kinds)
+        return where, args
+
+    def count(self, start=None, end=None, kinds=None):
+        where, args = self._where(start, end, kinds)
+        sql = "SELECT COUNT(*) FROM events" + (" WHERE " + " AND ".join(where) if where else "")
+        return self._conn().execute(sql, args).fetchone()[0]
+
+    def scan(self, limit, cursor=None, start=None, end=None, kinds=None, newest_first=True):
+        # Keyset page: [(position, kind, record)] after `cursor`, with
+        # position = (timestamp, kind, id) and timestamps in [start, end)
+        where, args = self._where(start, end, kinds)
+        if cursor is not None:
+            where.append(f"(timestamp, kind, id) {'<' if newest_first else '>'} (?, ?, ?)")
+            args.extend(cursor)
+        order = "DESC" if newest_first else "ASC"
+        sql = (
+            "SELECT timestamp, kind, id, record FROM events"
+            + (" WHERE " + " AND ".join(where) if where else "")
+            + f" ORDER BY timestamp {order}, kind {order}, id {order} LIMIT ?"
+        )
+        args.append(limit)
+        return [((ts, k, i), k, json.loads(rec))
+                for ts, k, i, rec in self._conn().execute(sql, args)]
+
+    def iter(self, start=None, end=None, kinds=None, newest_first=False, batch=500):
+        # Streams (kind, record) in timestamp order without loading everything
+        cursor = None
+        while True:
+            page = self.scan(batch, cursor, start, end, kinds, newest_first)
+            for _, kind, record in page:
+                yield kind, record
+            if len(page) < batch:
+                return
+            cursor = page[-1][0]
+
+    def stats(self):
+        rows = self._conn().execute("SELECT kind, COUNT(*) FROM events GROUP BY kind").fetchall()
+        return dict(rows)
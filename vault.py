@@ -0,0 +1,201 @@
+# ============================================================
+# AAA — HEALTH VAULT BLOB STORE
+# CHUNKED STREAMING WRITES • CONTENT-HASH DEDUP • REF COUNTS
+# ============================================================
+#
+# Layout under a vault directory:
+#
+#   blobs/ab/abcdef….pdf   one file per distinct content + extension
+#   index.json             display name → blob, plus a ref count per blob
+#
+# Uploads stream to a temp file in CHUNK_SIZE pieces while being hashed and
+# are renamed into place atomically. Identical content is stored once; a
+# different file under an existing name gets a "name (2).ext" display name
+# instead of overwriting the original. A blob is only deleted once no
+# display name refers to it.
+#
+# Index updates hold storage.file_lock(index.json), which also excludes
+# other processes sharing the vault directory.
+
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from storage import file_lock
+
+CHUNK_SIZE = 1024 * 1024
+UPLOAD_TYPES = (".png", ".jpg", ".jpeg", ".pdf")   # what the vault uploader accepts
+INDEX_NAME = "index.json"
+BLOB_DIR_NAME = "blobs"
+TMP_DIR_NAME = ".tmp"
+
+
+class Vault:
+    def __init__(self, root):
+        self.root = root
+        self.blob_dir = os.path.join(root, BLOB_DIR_NAME)
+        self.tmp_dir = os.path.join(root, TMP_DIR_NAME)
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self._lock = file_lock(self.index_path)
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self.adopt_loose_files()
+
+    # ---------- index ----------
+
+    def _read_index(self):
+        if not os.path.exists(self.index_path):
+            return {"files": {}, "blobs": {}}
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_index(self, index):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.index_path)
+
+    def _blob_path(self, blob_id):
+        # blob_id is the sha256 hex digest plus the file extension
+        return os.path.join(self.blob_dir, blob_id[:2], blob_id)
+
+    # ---------- writes ----------
+
+    def _stream_to_tmp(self, fileobj):
+        # Copy fileobj to a temp file chunk by chunk, hashing as we go;
+        # returns (tmp_path, digest, size)
+        if hasattr(fileobj, "seek"):
+            fileobj.seek(0)
+
+        h = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+                    h.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+
+            return tmp, h.hexdigest(), size
+        except:
+            os.remove(tmp)
+            raise
+
+    def _free_name(self, files, name):
+        if name not in files:
+            return name
+        stem, ext = os.path.splitext(name)
+        n = 2
+        while f"{stem} ({n}){ext}" in files:
+            n += 1
+        return f"{stem} ({n}){ext}"
+
+    def store(self, fileobj, name):
+        # Returns (display_name, is_new). Re-storing identical content under
+        # the same name is a no-op, so Streamlit reruns don't duplicate it.
+        ext = os.path.splitext(name)[1].lower()
+        tmp, digest, size = self._stream_to_tmp(fileobj)
+        blob_id = digest + ext
+
+        with self._lock:
+            # Publish the blob under the lock so a concurrent delete of the
+            # last reference can't remove it between the check and the index write
+            dest = self._blob_path(blob_id)
+            if os.path.exists(dest):
+                os.remove(tmp)
+            else:
+                os.makedirs(os.path.dirname(dest), exist_ok=True)
+                os.replace(tmp, dest)
+
+            index = self._read_index()
+            files, blobs = index["files"], index["blobs"]
+
+            # Same content already stored under this name (or a "(n)" variant)
+            stem, name_ext = os.path.splitext(name)
+            for existing, meta in files.items():
+                if meta["blob"] == blob_id and (
+                    existing == name or
+                    (existing.startswith(f"{stem} (") and existing.endswith(f"){name_ext}"))
+                ):
+                    return existing, False
+
+            display = self._free_name(files, name)
+            files[display] = {
+                "blob": blob_id,
+                "size": size,
+                "uploaded": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            blob = blobs.setdefault(blob_id, {"size": size, "refs": 0})
+            blob["refs"] += 1
+            self._write_index(index)
+            return display, True
+
+    def delete(self, name):
+        with self._lock:
+            index = self._read_index()
+            meta = index["files"].pop(name, None)
+            if meta is None:
+                return False
+
+            blob = index["blobs"].get(meta["blob"])
+            if blob is not None:
+                blob["refs"] -= 1
+                if blob["refs"] <= 0:
+                    del index["blobs"][meta["blob"]]
+                    path = self._blob_path(meta["blob"])
+                    # Index first: a crash leaves an orphan blob, never a dangling name
+                    self._write_index(index)
+                    if os.path.exists(path):
+                        os.remove(path)
+                    return True
+
+            self._write_index(index)
+            return True
+
+    def adopt_loose_files(self):
+        # Migrate uploads saved by the old direct-write uploader, which wrote
+        # them straight into the vault directory, into the blob store.
+        # Subdirectories (photos/, audio/, reports/) aren't uploads: other
+        # data files refer to their paths, so they are never touched.
+        with self._lock:
+            for name in sorted(os.listdir(self.root)):
+                path = os.path.join(self.root, name)
+                if name.startswith(".") or not name.lower().endswith(UPLOAD_TYPES) \
+                        or not os.path.isfile(path):
+                    continue
+                with open(path, "rb") as f:
+                    self.store(f, name)
+                os.remove(path)
+
+    # ---------- reads ----------
+
+    def list(self):
+        return sorted(self._read_index()["files"].keys())
+
+    def info(self, name):
+        return self._read_index()["files"].get(name)
+
+    def path_for(self, name):
+        meta = self.info(name)
+        if meta is None:
+            return None
+        return self._blob_path(meta["blob"])
+
+    def stats(self):
+        index = self._read_index()
+        logical = sum(m["size"] for m in index["files"].values())
+        physical = sum(b["size"] for b in index["blobs"].values())
+        return {
+            "files": len(index["files"]),
+            "blobs": len(index["blobs"]),
+            "logical_bytes": logical,
+            "stored_bytes": physical,
+            "saved_bytes": logical - physical,
+        }